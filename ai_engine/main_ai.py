@@ -5,7 +5,8 @@ import time
 import os
 import numpy as np
 import multiprocessing as mp
-from ultralytics import YOLO
+from detector import create_detector
+from tracking import create_tracker, update_tracker, TRACK_CONF
 
 # === 配置 ===
 # 容器内的视频路径
@@ -31,7 +32,8 @@ def worker(index, video_path):
         print(f"❌ Error: Video file not found: {video_path}")
         return
 
-    model = YOLO("yolov8n.pt")
+    detector = create_detector(weights="yolov8n.pt", conf=TRACK_CONF, classes=[2,3,5,7])
+    tracker = create_tracker()
     cap = cv2.VideoCapture(video_path)
     frame_cnt = 0
     
@@ -47,12 +49,12 @@ def worker(index, video_path):
         
         # === AI 推理 (每3帧一次) ===
         if frame_cnt % SKIP_FRAMES == 0:
-            results = model.track(frame, persist=True, verbose=False, classes=[2,3,5,7], tracker="bytetrack.yaml")
+            result = update_tracker(tracker, detector.detect([frame])[0], frame)
             
             tracks = []
-            if results[0].boxes.id is not None:
-                boxes = results[0].boxes.xyxy.cpu().numpy().astype(int)
-                ids = results[0].boxes.id.cpu().numpy().astype(int)
+            if len(result) > 0:
+                boxes = result[:, :4].astype(int)
+                ids = result[:, 4].astype(int)
                 for box, obj_id in zip(boxes, ids):
                     tracks.append([int(b) for b in box] + [int(obj_id)])
             
@@ -0,0 +1,165 @@
+# 准入控制 (Admission Control)
+# 每路摄像头最多只有一帧待处理：新帧到达时直接替换旧帧 (最新帧优先)，
+# 出队时丢弃已超过截止时间 (采集时间 + 延迟预算) 的帧。
+# 过载时积压被限制在 "摄像头数" 帧以内，延迟有上界；被丢弃的帧按摄像头计数。
+# FairScheduler 在此基础上按摄像头优先级分类：类间加权公平、类内最早截止优先。
+import time
+import queue
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+
+
+class AdmissionQueue:
+    """
+    与 queue.Queue 接口兼容 (put_nowait / get / get_nowait / qsize)，可直接给 MicroBatcher 使用。
+    item 需提供 key_fn(item) -> 摄像头 ID，deadline_fn(item) -> 截止时间 (time.time() 时钟)。
+    on_drop(item, reason) 在帧被替换 ("superseded") / 超时 ("expired") 丢弃时调用 (持锁调用，需非阻塞)，
+    REQ / DEALER 请求可借此回一个空结果，客户端不必等到超时。
+    """
+    def __init__(self, key_fn, deadline_fn, on_drop=None):
+        self.key_fn = key_fn
+        self.deadline_fn = deadline_fn
+        self.on_drop = on_drop
+        self.pending = OrderedDict()   # cam -> item，按摄像头首次排队的顺序出队
+        self.cond = threading.Condition()
+        self.stats = {}                # cam -> {"admitted", "superseded", "expired"}
+
+    def _stat(self, key):
+        st = self.stats.get(key)
+        if st is None: st = self.stats[key] = {"admitted": 0, "superseded": 0, "expired": 0}
+        return st
+
+    def put_nowait(self, item):
+        key = self.key_fn(item)
+        with self.cond:
+            st = self._stat(key)
+            st["admitted"] += 1
+            # 同一路已有待处理帧：新帧替换旧帧，但保留其排队位置，避免该路被饿死
+            old = self.pending.get(key)
+            if old is not None:
+                st["superseded"] += 1
+                self._drop(old, "superseded")
+            self.pending[key] = item
+            self.cond.notify()
+
+    put = put_nowait
+
+    def _drop(self, item, reason):
+        if self.on_drop is None: return
+        try: self.on_drop(item, reason)
+        except: pass
+
+    def _pop_live(self):
+        """弹出最早排队且未过期的一帧；过期帧计数后丢弃"""
+        now = time.time()
+        while self.pending:
+            key, item = self.pending.popitem(last=False)
+            if self.deadline_fn(item) >= now: return item
+            self._stat(key)["expired"] += 1
+            self._drop(item, "expired")
+        return None
+
+    def get(self, block=True, timeout=None):
+        end = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                item = self._pop_live()
+                if item is not None: return item
+                if not block: raise queue.Empty
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0: raise queue.Empty
+                self.cond.wait(remaining)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        return len(self.pending)
+
+    def dropped(self, key):
+        """该摄像头累计丢弃的帧数 (被新帧替换 + 超过截止时间)"""
+        st = self.stats.get(key)
+        return st["superseded"] + st["expired"] if st else 0
+
+    def snapshot(self):
+        with self.cond:
+            return {k: dict(v) for k, v in self.stats.items()}
+
+
+class FairScheduler(AdmissionQueue):
+    """
+    优先级感知的准入队列 (接口同 AdmissionQueue)：
+      - 类间加权公平 (WFQ)：每类一个虚拟时间，每出队一帧前进 1/weight，取虚拟时间最小的有帧类
+      - 类内最早截止优先 (EDF)
+    过载时低权重类的帧排得更久，先被新帧替换或超时丢弃；高权重类按权重拿到检测吞吐，延迟保持在预算内。
+    class_fn(item) -> 类名 (如 "HIGH" / "LOW")；weights: {类名: 权重}，未列出的类权重为 1。
+    """
+    def __init__(self, key_fn, deadline_fn, class_fn, weights, wait_samples=2048, on_drop=None):
+        super().__init__(key_fn, deadline_fn, on_drop)
+        self.class_fn = class_fn
+        self.weights = dict(weights)
+        self.vtime = {}
+        self.class_of = {}       # cam -> 最近一帧的类
+        self.enqueued_at = {}    # cam -> 待处理帧的入队时间
+        self.waits = {}          # 类 -> 最近 wait_samples 次排队时长 (秒)
+        self.wait_samples = wait_samples
+
+    def _backlogged(self):
+        return {self.class_of[k] for k in self.pending}
+
+    def put_nowait(self, item):
+        key, cls = self.key_fn(item), self.class_fn(item)
+        with self.cond:
+            active = self._backlogged()
+            # 类从空闲变为有帧时，虚拟时间对齐到当前活跃类的最小值，空闲期间不积累 "信用"
+            if cls not in active:
+                floor = min((self.vtime[c] for c in active), default=0.0)
+                self.vtime[cls] = max(self.vtime.get(cls, 0.0), floor)
+            self.class_of[key] = cls
+            self.enqueued_at[key] = time.time()
+            super().put_nowait(item)   # cond 为可重入锁
+
+    put = put_nowait
+
+    def _pop_live(self):
+        now = time.time()
+        heads = {}               # 类 -> (截止时间, cam)
+        for key, item in list(self.pending.items()):
+            deadline = self.deadline_fn(item)
+            if deadline < now:
+                del self.pending[key]
+                self._stat(key)["expired"] += 1
+                self._drop(item, "expired")
+                continue
+            cls = self.class_of[key]
+            if cls not in heads or deadline < heads[cls][0]: heads[cls] = (deadline, key)
+        if not heads: return None
+
+        cls = min(heads, key=lambda c: self.vtime[c])
+        key = heads[cls][1]
+        item = self.pending.pop(key)
+        self.vtime[cls] += 1.0 / self.weights.get(cls, 1.0)
+        st = self._stat(key)
+        st["served"] = st.get("served", 0) + 1
+        waits = self.waits.get(cls)
+        if waits is None: waits = self.waits[cls] = deque(maxlen=self.wait_samples)
+        waits.append(now - self.enqueued_at.pop(key, now))
+        return item
+
+    def class_snapshot(self):
+        """按类汇总：摄像头数、准入 / 替换 / 超时 / 处理帧数、排队时长分位数 (ms)"""
+        with self.cond:
+            out = {}
+            for key, st in self.stats.items():
+                c = out.setdefault(self.class_of.get(key, "?"), {"cams": 0, "admitted": 0, "superseded": 0,
+                                                                  "expired": 0, "served": 0, "pending": 0})
+                c["cams"] += 1
+                c["pending"] += key in self.pending
+                for field in ("admitted", "superseded", "expired", "served"): c[field] += st.get(field, 0)
+            for cls, waits in self.waits.items():
+                if not waits or cls not in out: continue
+                p50, p95, p99 = np.percentile(np.array(waits) * 1000, [50, 95, 99])
+                out[cls].update(wait_p50_ms=round(float(p50), 2), wait_p95_ms=round(float(p95), 2),
+                                wait_p99_ms=round(float(p99), 2))
+            return out
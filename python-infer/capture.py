@@ -0,0 +1,82 @@
+# 独立视频读取线程 (Capture Stage)
+# 解码放在自己的线程里 (OpenCV 解码时释放 GIL)，不再阻塞推理循环：
+#   - 跳帧只 grab() 不 retrieve()，被丢弃的帧不做颜色转换和拷贝
+#   - 按视频自身时间戳 (POS_MSEC) 控制节拍，而不是能读多快读多快
+#   - 结果写进最新帧槽，消费者永远拿到最新的一帧
+import time
+import threading
+import cv2
+
+from mjpeg_hub import LatestFrame
+
+
+class VideoReader:
+    """后台解码线程 + 最新帧槽"""
+    def __init__(self, path, size=None, skip=0, speed=1.0, loop=True, slot=None, timer=None):
+        self.path = path
+        self.size = size      # (w, h)，None 表示不缩放
+        self.skip = skip      # 每取 1 帧前跳过的帧数 (只 grab)
+        self.speed = speed    # 播放倍速 (按视频时间戳折算)
+        self.loop = loop
+        self.slot = slot if slot is not None else LatestFrame()
+        self.timer = timer    # 可选 timer(stage, seconds)，记录 decode / resize 耗时
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+
+    def wait_newer(self, last_seq, timeout=1.0, out=None):
+        return self.slot.wait_newer(last_seq, timeout=timeout)
+
+    def _run(self):
+        cap = cv2.VideoCapture(self.path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        grabbed = 0
+        t0_wall = t0_video = None
+
+        while self.running:
+            # === 跳帧：只 grab 不 retrieve，几乎不占 CPU ===
+            t_grab = time.perf_counter()
+            for _ in range(self.skip):
+                if cap.grab(): grabbed += 1
+            if not cap.grab():
+                if not self.loop: break
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                grabbed = 0
+                t0_wall = None
+                continue
+            grabbed += 1
+            decode_s = time.perf_counter() - t_grab
+
+            # === 按视频时间戳节拍 ===
+            video_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+            if video_ms <= 0: video_ms = grabbed / fps * 1000.0
+            now = time.time()
+            if t0_wall is None:
+                t0_wall, t0_video = now, video_ms
+            else:
+                delay = t0_wall + (video_ms - t0_video) / 1000.0 / self.speed - now
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -0.5:
+                    # 落后太多 (例如系统卡顿)，重新对齐时钟而不是追帧
+                    t0_wall, t0_video = now, video_ms
+
+            t_dec = time.perf_counter()
+            ok, frame = cap.retrieve()
+            if not ok: continue
+            t_res = time.perf_counter()
+            if self.size is not None: frame = cv2.resize(frame, self.size)
+            if self.timer is not None:
+                self.timer("decode", decode_s + t_res - t_dec)
+                self.timer("resize", time.perf_counter() - t_res)
+            self.slot.publish(frame, capture_ts=time.time())
+
+        cap.release()
@@ -1,16 +1,39 @@
 import cv2
 import imagezmq
+import zmq
 import json
 import time
-import math
 import psutil
+import threading
 import numpy as np
-from ultralytics import YOLO
+from concurrent.futures import ThreadPoolExecutor
+from detector import create_detector, warmup
+from tracking import create_tracker, update_tracker, TRACK_CONF
 import hyperlpr3
+from track_store import TrackStore
+from result_codec import encode_batch, KIND_EDGE
+from jpeg_decode import JpegDecoder
+from micro_batch import MicroBatcher
+from admission import FairScheduler
+from sharded_executor import ShardedExecutor
 
 # ================= 配置 =================
 MODEL_PATH = "yolov8n.pt" 
 PIXELS_PER_METER = 25 
+# 回复格式："binary" (result_codec，Pi 端自动识别) / "json" (旧版 Pi 客户端)
+REPLY_FORMAT = "binary"
+PORT = 5555
+# 服务模式："router" 异步 ROUTER，多个请求同时在途 (与 imagezmq.ImageSender 客户端兼容)；
+#           "hub" 原 ImageHub 逐帧串行
+SERVER_MODE = "router"
+SHARD_THREADS = 4        # 分析 / LPR 分片线程数 (每路摄像头固定一个分片)
+BATCH_MAX_FRAMES = 8     # 跨摄像头微批检测
+BATCH_WINDOW_MS = 5
+REPLY_ADDR = "inproc://cloud-replies"
+# 优先级调度 (router 模式)：每路只保留最新一帧，类间按权重公平、类内最早截止优先；
+# 预算从收到请求算起，需小于 Pi 端的接收超时 (800ms)，被替换 / 超时的请求立即回空结果
+CAMERA_PRIORITY = {"C1": "HIGH", "C2": "HIGH", "C3": "LOW", "C4": "LOW"}
+PRIORITY_CLASSES = {"HIGH": {"weight": 3, "budget_ms": 300}, "LOW": {"weight": 1, "budget_ms": 600}}
 
 # ================= 环境感知 =================
 class EnvironmentAnalyst:
@@ -33,7 +56,8 @@ class EnvironmentAnalyst:
 # ================= 交通分析 =================
 class TrafficAnalyst:
     def __init__(self):
-        self.track_history = {} 
+        # 轨迹存在预分配的环形缓冲里，最多保留最近 10 个点
+        self.store = TrackStore(history=10)
         self.speeds = {}        
         self.logs = []
         self.line_y_ratio = 0.6
@@ -54,52 +78,41 @@ class TrafficAnalyst:
         if congestion > 8: status = "JAM"
         elif congestion > 5: status = "BUSY"
 
-        current_ids = []
-        for box in tracks:
-            if len(box) < 5: continue
-            x1, y1, x2, y2, obj_id = box
-            cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
-            current_ids.append(obj_id)
-
-            if obj_id not in self.track_history: self.track_history[obj_id] = []
-            self.track_history[obj_id].append((cx, cy, current_time))
-            if len(self.track_history[obj_id]) > 10: self.track_history[obj_id].pop(0)
-
-            if len(self.track_history[obj_id]) >= 3:
-                last = self.track_history[obj_id][-1]
-                first = self.track_history[obj_id][0]
-                dist = math.sqrt((last[0]-first[0])**2 + (last[1]-first[1])**2)
-                t_diff = last[2] - first[2]
-                if t_diff > 0.05:
-                    speed = int((dist / PIXELS_PER_METER) / t_diff * 3.6)
-                    self.speeds[obj_id] = speed
-
-            prev_y = self.track_history[obj_id][0][1] if len(self.track_history[obj_id]) > 0 else cy
-            direction = None
-            if prev_y < line_y and cy >= line_y: direction = "Down"
-            elif prev_y > line_y and cy <= line_y: direction = "Up"
-
-            if direction:
-                self.triggered = True
-                self.trigger_timer = 5
-                pad = 10
-                crop = frame_img[max(0, y1-pad):min(h, y2+pad), max(0, x1-pad):min(w, x2+pad)]
-                if crop.size > 0:
-                    try:
-                        res = lpr_instance(crop)
-                        if res:
-                            txt, conf, _ = res[0]
-                            if conf > 0.7: self.latest_plate = txt
-                    except: pass
-                
-                log = f"ID:{obj_id} {direction} {self.speeds.get(obj_id,0)}km {self.latest_plate}"
-                if not self.logs or self.logs[-1] != log:
-                    self.logs.append(log)
-                    if len(self.logs) > 5: self.logs.pop(0)
-
-        valid = set(current_ids)
-        self.track_history = {k:v for k,v in self.track_history.items() if k in valid}
-        avg_spd = int(sum(self.speeds.values())/len(self.speeds)) if self.speeds else 0
+        arr = np.asarray([t[:5] for t in tracks if len(t) >= 5], dtype=np.int64).reshape(-1, 5)
+        boxes, ids = arr[:, :4], arr[:, 4]
+        centers = np.stack([(boxes[:, 0] + boxes[:, 2]) // 2, (boxes[:, 1] + boxes[:, 3]) // 2], axis=1)
+        slots = self.store.push(ids, centers, current_time)
+
+        # 速度估算 (向量化)
+        self.store.update_speeds(slots, PIXELS_PER_METER, min_samples=3, min_dt=0.05)
+        spd_ids, spd_vals = self.store.speeds_of(slots)
+        self.speeds = dict(zip(spd_ids.tolist(), spd_vals.tolist()))
+
+        # 过线检测 (只遍历过线的车辆)
+        directions = self.store.crossings(slots, line_y)
+        for k in np.flatnonzero(directions):
+            x1, y1, x2, y2 = boxes[k].tolist()
+            obj_id = int(ids[k])
+            direction = "Down" if directions[k] > 0 else "Up"
+            self.triggered = True
+            self.trigger_timer = 5
+            pad = 10
+            crop = frame_img[max(0, y1-pad):min(h, y2+pad), max(0, x1-pad):min(w, x2+pad)]
+            if crop.size > 0:
+                try:
+                    res = lpr_instance(crop)
+                    if res:
+                        txt, conf, _ = res[0]
+                        if conf > 0.7: self.latest_plate = txt
+                except: pass
+            
+            log = f"ID:{obj_id} {direction} {self.speeds.get(obj_id,0)}km {self.latest_plate}"
+            if not self.logs or self.logs[-1] != log:
+                self.logs.append(log)
+                if len(self.logs) > 5: self.logs.pop(0)
+
+        self.store.evict_stale()
+        avg_spd = int(spd_vals.mean()) if len(spd_vals) else 0
         
         return {
             "idx": congestion, "status": status, "avg_spd": avg_spd,
@@ -107,55 +120,177 @@ class TrafficAnalyst:
             "triggered": self.triggered
         }
 
-def main():
-    print("="*50)
-    print("🚀 PC CLOUD BRAIN V6 (Data Integrity)")
-    print("="*50)
+def analyze_frame(analyst, env_analyst, lpr, frame, tracks):
+    """环境感知 + 交通分析 -> 回复字典"""
+    # 1. 环境感知
+    env_info = env_analyst.analyze(frame)
     
-    model = YOLO(MODEL_PATH)
-    lpr = hyperlpr3.LicensePlateCatcher()
+    formatted_tracks = []
+    if len(tracks) > 0:
+        boxes = tracks[:, :4].astype(int)
+        ids = tracks[:, 4].astype(int)
+        for box, obj_id in zip(boxes, ids):
+            formatted_tracks.append([int(b) for b in box] + [int(obj_id)])
+    
+    # 3. 交通分析
+    metrics = analyst.update(formatted_tracks, frame, lpr)
+    
+    # 4. PC CPU
+    pc_cpu = psutil.cpu_percent()
+    
+    return {
+        "tracks": formatted_tracks,
+        "metrics": metrics,
+        "env": env_info,
+        "pc_cpu": pc_cpu
+    }
+
+def encode_reply(response):
+    if REPLY_FORMAT == "binary": return b"".join(encode_batch([response], KIND_EDGE))
+    return json.dumps(response).encode('utf-8')
+
+def serve_hub(detector, lpr):
+    """原 ImageHub (REP) 模式：逐帧串行处理"""
     env_analyst = EnvironmentAnalyst()
     analysts = {}
-    image_hub = imagezmq.ImageHub(open_port='tcp://*:5555')
+    trackers = {}   # 每路摄像头独立的跟踪器状态
+    image_hub = imagezmq.ImageHub(open_port=f'tcp://*:{PORT}')
     
     while True:
         cam_id, jpg_bytes = image_hub.recv_jpg()
         try:
             frame = cv2.imdecode(np.frombuffer(jpg_bytes, dtype='uint8'), -1)
-            if cam_id not in analysts: analysts[cam_id] = TrafficAnalyst()
-            
-            # 1. 环境感知
-            env_info = env_analyst.analyze(frame)
+            if cam_id not in analysts:
+                analysts[cam_id] = TrafficAnalyst()
+                trackers[cam_id] = create_tracker()
             
             # 2. YOLO
-            results = model.track(frame, persist=True, verbose=False, 
-                                classes=[2, 3, 5, 7], tracker="bytetrack.yaml")
-            
-            formatted_tracks = []
-            if results[0].boxes.id is not None:
-                boxes = results[0].boxes.xyxy.cpu().numpy().astype(int)
-                ids = results[0].boxes.id.cpu().numpy().astype(int)
-                for box, obj_id in zip(boxes, ids):
-                    formatted_tracks.append([int(b) for b in box] + [int(obj_id)])
-            
-            # 3. 交通分析
-            metrics = analysts[cam_id].update(formatted_tracks, frame, lpr)
-            
-            # 4. PC CPU
-            pc_cpu = psutil.cpu_percent()
-            
-            response = {
-                "tracks": formatted_tracks,
-                "metrics": metrics,
-                "env": env_info,
-                "pc_cpu": pc_cpu
-            }
-            
-            image_hub.send_reply(json.dumps(response).encode('utf-8'))
-            print(f"\r⚡ {cam_id}: {env_info['weather']} | {metrics['status']}   ", end="")
+            tracks = update_tracker(trackers[cam_id], detector.detect([frame])[0], frame)
+            response = analyze_frame(analysts[cam_id], env_analyst, lpr, frame, tracks)
+            image_hub.send_reply(encode_reply(response))
+            print(f"\r⚡ {cam_id}: {response['env']['weather']} | {response['metrics']['status']}   ", end="")
             
         except Exception as e:
             image_hub.send_reply(b"{}")
 
+def serve_router(detector, lpr):
+    """
+    异步 ROUTER 模式，与 imagezmq.ImageSender (REQ) 线上兼容：
+      请求 [信封..., b'', json{"msg": cam_id}, jpg]  ->  回复 [信封..., b'', reply]
+    主线程只收发；请求经 FairScheduler 按摄像头优先级出队，跨摄像头微批检测 + 按出队顺序推进各路跟踪器；
+    环境感知 / 测速 / LPR 交给该摄像头所在的分片 (同一路串行有序，不同路并行)。
+    分片线程经 inproc PUSH 把回复交回主线程 (ROUTER socket 只在主线程使用)。
+    """
+    ctx = zmq.Context.instance()
+    router = ctx.socket(zmq.ROUTER)
+    router.setsockopt(zmq.LINGER, 0)
+    router.bind(f"tcp://*:{PORT}")
+    replies = ctx.socket(zmq.PULL)
+    replies.bind(REPLY_ADDR)   # inproc 需先 bind 再 connect
+
+    local = threading.local()
+    def reply(envelope, payload):
+        sock = getattr(local, "sock", None)
+        if sock is None:
+            sock = local.sock = ctx.socket(zmq.PUSH)
+            sock.connect(REPLY_ADDR)
+        sock.send_multipart(envelope + [payload])
+
+    env_analyst = EnvironmentAnalyst()
+    analysts = {}   # 只由该摄像头的分片访问
+    trackers = {}   # 只由微批调度线程访问
+    decoder = JpegDecoder()
+    shards = ShardedExecutor(n_shards=SHARD_THREADS, name="cam")
+    executor = ThreadPoolExecutor(max_workers=SHARD_THREADS)
+
+    def analyze(envelope, cam_id, frame, tracks):
+        payload = b"{}"
+        try:
+            analyst = analysts.get(cam_id)
+            if analyst is None: analyst = analysts[cam_id] = TrafficAnalyst()
+            response = analyze_frame(analyst, env_analyst, lpr, frame, tracks)
+            payload = encode_reply(response)
+            print(f"\r⚡ {cam_id}: {response['env']['weather']} | {response['metrics']['status']}   ", end="")
+        except Exception as e:
+            print(f"\n❌ {cam_id} Analyze Error: {e}")
+        decoder.release(frame)
+        reply(envelope, payload)
+
+    def handle(batch):
+        frames = list(executor.map(lambda item: decoder.decode(item[2].buffer), batch))
+        live = []
+        for (envelope, cam_id, _, _), frame in zip(batch, frames):
+            if frame is None: reply(envelope, b"{}")
+            else: live.append((envelope, cam_id, frame))
+        if not live: return
+        try:
+            dets = detector.detect([frame for _, _, frame in live])
+        except Exception as e:
+            print(f"\n❌ Inference Error: {e}")
+            for envelope, _, frame in live:
+                decoder.release(frame)
+                reply(envelope, b"{}")
+            return
+        for (envelope, cam_id, frame), det in zip(live, dets):
+            tracker = trackers.get(cam_id)
+            if tracker is None: tracker = trackers[cam_id] = create_tracker()
+            tracks = update_tracker(tracker, det, frame)
+            shards.submit(cam_id, analyze, envelope, cam_id, frame, tracks)
+
+    def priority(item):
+        return CAMERA_PRIORITY.get(item[1], "LOW")
+
+    def deadline(item):
+        budget = PRIORITY_CLASSES.get(priority(item), PRIORITY_CLASSES["LOW"])["budget_ms"]
+        return item[3] + budget / 1000.0
+
+    # 元素为 (envelope, cam_id, jpg, t_recv)；被丢弃的请求也要回复，REQ 客户端才能发下一帧
+    scheduler = FairScheduler(key_fn=lambda item: item[1], deadline_fn=deadline, class_fn=priority,
+                              weights={c: v["weight"] for c, v in PRIORITY_CLASSES.items()},
+                              on_drop=lambda item, reason: reply(item[0], b"{}"))
+    batcher = MicroBatcher(handle, max_batch=BATCH_MAX_FRAMES, window=BATCH_WINDOW_MS / 1000.0, q=scheduler)
+    poller = zmq.Poller()
+    poller.register(router, zmq.POLLIN)
+    poller.register(replies, zmq.POLLIN)
+    print(f"✅ ROUTER mode on :{PORT} ({SHARD_THREADS} shards, batch {BATCH_MAX_FRAMES} / {BATCH_WINDOW_MS}ms)")
+
+    while True:
+        socks = dict(poller.poll(100))
+        if router in socks:
+            msg = router.recv_multipart(copy=False)
+            # REQ 信封以空帧结尾 (经代理时可能有多层身份帧)；找不到信封就无法回复，只能丢弃
+            sep = next((k for k, f in enumerate(msg) if len(f) == 0), None)
+            if sep is None:
+                print(f"\n⚠️ Malformed request ({len(msg)} frames)")
+            else:
+                envelope = [f.bytes for f in msg[:sep + 1]]
+                try:
+                    meta = json.loads(msg[sep + 1].bytes)
+                    if not isinstance(meta, dict): raise ValueError("header is not an object")
+                    ok = batcher.submit((envelope, meta.get("msg"), msg[sep + 2], time.time()))
+                except Exception as e:
+                    print(f"\n⚠️ Malformed request ({len(msg)} frames): {e}")
+                    ok = False
+                # 信封已解析：无论如何都要回一帧，否则 REQ 客户端会一直卡在 recv
+                if not ok: router.send_multipart(envelope + [b"{}"])
+        if replies in socks:
+            while True:
+                try: router.send_multipart(replies.recv_multipart(zmq.NOBLOCK))
+                except zmq.Again: break
+
+def main():
+    print("="*50)
+    print("🚀 PC CLOUD BRAIN V6 (Data Integrity)")
+    print("="*50)
+    
+    detector = create_detector(weights=MODEL_PATH, conf=TRACK_CONF, classes=[2, 3, 5, 7])
+    lpr = hyperlpr3.LicensePlateCatcher()
+    if SERVER_MODE == "router":
+        # 按满批预热，首批真实请求不再承担初始化开销
+        warmup(detector, batch=BATCH_MAX_FRAMES)
+        serve_router(detector, lpr)
+    else:
+        serve_hub(detector, lpr)
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,44 +1,71 @@
+import os
 import zmq
-import cv2
-import numpy as np
 import json
 import time
-from ultralytics import YOLO
+import queue
+import multiprocessing as mp
+from collections import deque
+from detector import create_detector, warmup
+from jpeg_decode import JpegDecoder
+from startup import use_warm_start
+from admission import FairScheduler
+
+# 检测输入尺寸 (原图足够大时按 1/2、1/4、1/8 直接解码)
+INFER_IMGSZ = 320
+
+# 代理模式：前端 ROUTER 接 Go 端的 DEALER，后端 ROUTER 接 CLOUD_WORKERS 个推理进程 (各自加载模型)，
+# 按最近最少使用 (LRU) 分发；CLOUD_WORKERS=0 时沿用单线程内联推理
+CLOUD_WORKERS = int(os.environ.get("CLOUD_WORKERS", "4"))
+FRONTEND_ADDR = "tcp://*:5555"
+BACKEND_ADDR = "tcp://127.0.0.1:5560"
+READY = b"READY"
+# 优先级调度 (代理模式)：每路只保留最新一帧，类间按权重公平、类内最早截止优先。
+# 预算从收到请求算起，需小于 Go 端 DEALER 的接收超时 (1000ms)；被替换 / 超时的请求回 {"status": "dropped"}
+CAMERA_PRIORITY = {"CAM-0": "HIGH", "CAM-1": "HIGH", "CAM-2": "LOW", "CAM-3": "LOW"}
+PRIORITY_CLASSES = {"HIGH": {"weight": 3, "budget_ms": 300}, "LOW": {"weight": 1, "budget_ms": 800}}
+DROPPED = json.dumps({"status": "dropped"}).encode()
+
+def request_priority(item):
+    return CAMERA_PRIORITY.get(item[1], "LOW")
+
+def request_deadline(item):
+    budget = PRIORITY_CLASSES.get(request_priority(item), PRIORITY_CLASSES["LOW"])["budget_ms"]
+    return item[2] + budget / 1000.0
+
+def process_frame(detector, decoder, cam_id, buf):
+    # 只需计数：按推理尺寸直接降分辨率解码 (省掉全尺寸解码 + 缩放)
+    frame = decoder.decode_for(buf, INFER_IMGSZ)
+    if frame is None: return {"status": "error"}
+    # 推理
+    dets = detector.detect([frame.img])[0]
+    frame.release()
+    return {"status": "ok", "cam": cam_id, "count": len(dets)}
 
 def start_pc_service():
     context = zmq.Context()
     socket = context.socket(zmq.ROUTER)
     # LINGER 设置为 0 确保关闭时立即释放端口
     socket.setsockopt(zmq.LINGER, 0)
-    socket.bind("tcp://*:5555")
+    socket.bind(FRONTEND_ADDR)
     
     print("正在加载 YOLOv8 模型...")
-    model = YOLO("yolov8n.pt") 
+    detector = create_detector(weights="yolov8n.pt", imgsz=INFER_IMGSZ)
+    decoder = JpegDecoder()
     print("✅ PC ROUTER 服务已就绪，正在监听端口 5555...")
 
     while True:
         try:
             # ROUTER 接收到的格式: [WorkerID, CAM_ID, ImageBytes] (共3帧)
-            frames = socket.recv_multipart()
+            # copy=False: 图像直接从消息缓冲区解码，不先拷贝成 bytes
+            frames = socket.recv_multipart(copy=False)
             
             if len(frames) < 3:
                 print(f"⚠️ 收到异常帧数: {len(frames)}")
                 continue
             
-            worker_id = frames[0]
-            cam_id = frames[1].decode()
-            img_bytes = frames[2]
-            
-            # 模拟处理
-            nparr = np.frombuffer(img_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if frame is not None:
-                # 推理
-                results = model.predict(frame, imgsz=320, verbose=False)
-                response = {"status": "ok", "cam": cam_id, "count": len(results[0].boxes)}
-            else:
-                response = {"status": "error"}
+            worker_id = frames[0].bytes
+            cam_id = frames[1].bytes.decode()
+            response = process_frame(detector, decoder, cam_id, frames[2].buffer)
 
             # ROUTER 回复格式: [WorkerID, JsonPayload] (共2帧)
             # ZMQ 会根据 WorkerID 自动路由到正确的树莓派线程
@@ -48,5 +75,117 @@ def start_pc_service():
             print(f"❌ 运行错误: {e}")
             time.sleep(0.1)
 
+def inference_worker(idx, n_workers):
+    """推理进程：REQ 连到代理后端，先发 READY；之后每发回一个结果就表示自己空闲"""
+    # 各进程平分 CPU 核，避免 N 份模型各开满线程互相抢占
+    try:
+        import torch
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // n_workers))
+    except ImportError: pass
+    detector = create_detector(weights="yolov8n.pt", imgsz=INFER_IMGSZ)
+    warmup(detector, INFER_IMGSZ)
+    decoder = JpegDecoder()
+
+    context = zmq.Context()
+    socket = context.socket(zmq.REQ)
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.setsockopt(zmq.IDENTITY, f"PY-{idx}".encode())
+    socket.connect(BACKEND_ADDR)
+    socket.send(READY)
+
+    while True:
+        # [ClientID, CAM_ID, ImageBytes] (REQ 已剥掉空分隔帧)
+        frames = socket.recv_multipart(copy=False)
+        client_id = frames[0].bytes
+        try:
+            response = process_frame(detector, decoder, frames[1].bytes.decode(), frames[2].buffer)
+        except Exception as e:
+            print(f"❌ Worker {idx} 运行错误: {e}")
+            response = {"status": "error"}
+        socket.send_multipart([client_id, json.dumps(response).encode()])
+
+def start_broker(n_workers):
+    """
+    LRU 代理：空闲推理进程排成队列，前端请求先进 FairScheduler，有空闲进程时立即出队交给最早空闲的进程；
+    只有所有进程都忙时请求才会排队，此时每路只留最新一帧 (旧帧回 dropped)、按摄像头优先级出队。
+    积压不超过摄像头数，图像帧原样转发，不拷贝。
+      前端: [WorkerID, CAM_ID, ImageBytes] -> 后端: [PyWorker, b'', WorkerID, CAM_ID, ImageBytes]
+      后端: [PyWorker, b'', WorkerID, Json] -> 前端: [WorkerID, Json]
+    """
+    use_warm_start(["__main__", "numpy", "cv2", "detector", "jpeg_decode"])
+    # onnx 后端的线程数同样平分 (子进程导入 detector 时读取)
+    os.environ.setdefault("ONNX_THREADS", str(max(1, (os.cpu_count() or 1) // n_workers)))
+
+    context = zmq.Context()
+    frontend = context.socket(zmq.ROUTER)
+    frontend.setsockopt(zmq.LINGER, 0)
+    frontend.bind(FRONTEND_ADDR)
+    backend = context.socket(zmq.ROUTER)
+    backend.setsockopt(zmq.LINGER, 0)
+    # 目标进程已退出时 send 抛错，而不是静默丢弃请求
+    backend.setsockopt(zmq.ROUTER_MANDATORY, 1)
+    backend.bind(BACKEND_ADDR)
+
+    procs = [mp.Process(target=inference_worker, args=(i, n_workers), daemon=True) for i in range(n_workers)]
+    for p in procs: p.start()
+    print(f"正在启动 {n_workers} 个推理进程...")
+
+    idle = deque()   # 左端为最早空闲的进程
+    # 元素为 (frames, cam_id, t_recv)；调度器只在本线程使用，on_drop 里可直接写前端
+    scheduler = FairScheduler(key_fn=lambda item: item[1], deadline_fn=request_deadline,
+                              class_fn=request_priority,
+                              weights={c: v["weight"] for c, v in PRIORITY_CLASSES.items()},
+                              on_drop=lambda item, reason: frontend.send_multipart([item[0][0], DROPPED]))
+
+    def dispatch():
+        """把排队的请求按优先级交给空闲进程 (有空闲进程时队列里不会积压)"""
+        while idle:
+            try: item = scheduler.get_nowait()
+            except queue.Empty: return
+            frames = item[0]
+            while idle:
+                worker = idle.popleft()
+                try:
+                    backend.send_multipart([worker, b""] + frames[:3], copy=False)
+                    break
+                except zmq.ZMQError:
+                    print(f"⚠️ {worker.decode()} 已退出")
+            else:
+                frontend.send_multipart([frames[0], json.dumps({"status": "error"}).encode()])
+
+    poller = zmq.Poller()
+    poller.register(backend, zmq.POLLIN)
+    poller.register(frontend, zmq.POLLIN)
+    served = 0
+
+    while True:
+        try:
+            socks = dict(poller.poll(100))
+            if backend in socks:
+                msg = backend.recv_multipart(copy=False)
+                idle.append(msg[0].bytes)
+                if len(msg) > 3:
+                    frontend.send_multipart(msg[2:], copy=False)
+                    served += 1
+                elif msg[2].bytes == READY:
+                    print(f"✅ {msg[0].bytes.decode()} 就绪 ({len(idle)}/{n_workers})")
+                dispatch()
+
+            if frontend in socks:
+                while True:
+                    try: frames = frontend.recv_multipart(zmq.NOBLOCK, copy=False)
+                    except zmq.Again: break
+                    if len(frames) < 3:
+                        print(f"⚠️ 收到异常帧数: {len(frames)}")
+                        continue
+                    scheduler.put_nowait((frames, frames[1].bytes.decode(errors="replace"), time.time()))
+                    # 逐个派发：有空闲进程时同一路的连续帧不会互相替换
+                    dispatch()
+        except KeyboardInterrupt: break
+        except Exception as e:
+            print(f"❌ 代理错误: {e}")
+            time.sleep(0.1)
+
 if __name__ == "__main__":
-    start_pc_service()
\ No newline at end of file
+    if CLOUD_WORKERS > 0: start_broker(CLOUD_WORKERS)
+    else: start_pc_service()
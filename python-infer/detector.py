@@ -0,0 +1,287 @@
+# 检测器抽象 (Detector Backend)
+# 所有脚本统一通过 create_detector() 拿检测器，只做检测不做跟踪 (跟踪见 tracking.py)：
+#   - ultralytics: 原来的 PyTorch 路径
+#   - onnx:        ONNX Runtime CPU 路径，会话复用 + 预分配 IO Binding，
+#                  NumPy 实现 letterbox / NMS，可选静态 INT8 量化
+# 通过环境变量切换，不用逐个改脚本：
+#   DETECTOR_BACKEND=onnx ONNX_INT8=1 ONNX_CALIB_DIR=./calib python inference_pto.py
+import os
+import ast
+import glob
+import time
+import numpy as np
+import cv2
+
+DETECTOR_BACKEND = os.environ.get("DETECTOR_BACKEND", "ultralytics")
+ONNX_INT8 = os.environ.get("ONNX_INT8", "0") == "1"
+ONNX_CALIB_DIR = os.environ.get("ONNX_CALIB_DIR", "")
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", "0"))  # 0 = 由 onnxruntime 决定
+
+MAX_DETS = 300
+# 类别偏移量：把不同类别的框错开，一次 NMS 完成按类别抑制
+MAX_WH = 7680
+
+
+class Detections:
+    """一帧的检测结果 (NumPy)，字段与 ultralytics Boxes 对齐，可直接交给 BYTETracker"""
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+        self.cls = np.asarray(cls, dtype=np.float32).reshape(-1)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 4)), np.zeros(0), np.zeros(0))
+
+    @classmethod
+    def from_boxes(cls, boxes):
+        boxes = boxes.cpu().numpy()
+        return cls(boxes.xyxy, boxes.conf, boxes.cls)
+
+    @property
+    def xywh(self):
+        b = self.xyxy
+        return np.stack([(b[:, 0] + b[:, 2]) / 2, (b[:, 1] + b[:, 3]) / 2,
+                         b[:, 2] - b[:, 0], b[:, 3] - b[:, 1]], axis=1)
+
+    def __len__(self):
+        return len(self.conf)
+
+    def __getitem__(self, idx):
+        return Detections(self.xyxy[idx], self.conf[idx], self.cls[idx])
+
+
+# ================= 预处理 / 后处理 (NumPy) =================
+def letterbox(img, size, out=None, color=114):
+    """等比缩放 + 居中填充到 size x size，返回 (画布, 缩放比, (pad_x, pad_y))"""
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nw, nh = int(round(w * r)), int(round(h * r))
+    pad_x, pad_y = (size - nw) // 2, (size - nh) // 2
+    if out is None: out = np.empty((size, size, 3), dtype=np.uint8)
+    out[:] = color
+    roi = out[pad_y:pad_y + nh, pad_x:pad_x + nw]
+    if (nw, nh) == (w, h): roi[:] = img
+    else: cv2.resize(img, (nw, nh), dst=roi, interpolation=cv2.INTER_LINEAR)
+    return out, r, (pad_x, pad_y)
+
+
+def nms(boxes, scores, iou_thres):
+    """经典贪心 NMS，返回保留下标 (按分数降序)"""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        if len(keep) >= MAX_DETS: break
+        rest = order[1:]
+        xx1 = np.maximum(x1[i], x1[rest]); yy1 = np.maximum(y1[i], y1[rest])
+        xx2 = np.minimum(x2[i], x2[rest]); yy2 = np.minimum(y2[i], y2[rest])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        order = rest[iou <= iou_thres]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def postprocess(pred, conf_thres, iou_thres, classes, ratio, pad, orig_shape):
+    """YOLOv8 原始输出 (4+nc, N) -> 原图坐标的 Detections"""
+    pred = pred.T
+    scores_all = pred[:, 4:]
+    cls = scores_all.argmax(axis=1)
+    conf = scores_all[np.arange(len(cls)), cls]
+    mask = conf > conf_thres
+    if classes is not None: mask &= np.isin(cls, classes)
+    if not mask.any(): return Detections.empty()
+
+    boxes, conf, cls = pred[mask, :4], conf[mask], cls[mask]
+    xyxy = np.empty_like(boxes)
+    xyxy[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
+    xyxy[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
+    xyxy[:, 2] = boxes[:, 0] + boxes[:, 2] / 2
+    xyxy[:, 3] = boxes[:, 1] + boxes[:, 3] / 2
+
+    keep = nms(xyxy + cls[:, None] * MAX_WH, conf, iou_thres)
+    xyxy, conf, cls = xyxy[keep], conf[keep], cls[keep]
+
+    # 去掉 letterbox 的填充和缩放，回到原图坐标
+    xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - pad[0]) / ratio
+    xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - pad[1]) / ratio
+    h, w = orig_shape[:2]
+    xyxy[:, [0, 2]] = np.clip(xyxy[:, [0, 2]], 0, w)
+    xyxy[:, [1, 3]] = np.clip(xyxy[:, [1, 3]], 0, h)
+    return Detections(xyxy, conf, cls)
+
+
+# ================= 后端实现 =================
+class UltralyticsDetector:
+    """PyTorch (ultralytics) 后端"""
+    def __init__(self, weights="yolov8n.pt", imgsz=640, conf=0.25, iou=0.7, classes=None, device=None):
+        from ultralytics import YOLO
+        self.model = YOLO(weights)
+        self.imgsz, self.conf, self.iou = imgsz, conf, iou
+        self.classes, self.device = classes, device
+
+    def detect(self, images, imgsz=None):
+        """images: BGR 图像列表，返回等长的 Detections 列表 (一次批量前向)"""
+        results = self.model.predict(list(images), imgsz=imgsz or self.imgsz, conf=self.conf, iou=self.iou,
+                                     classes=self.classes, device=self.device, verbose=False)
+        return [Detections.from_boxes(r.boxes) for r in results]
+
+
+class OnnxDetector:
+    """ONNX Runtime CPU 后端：会话复用，按 (batch, imgsz) 预分配输入输出并绑定"""
+    def __init__(self, onnx_path, imgsz=640, conf=0.25, iou=0.7, classes=None, threads=ONNX_THREADS):
+        import onnxruntime as ort
+        self.ort = ort
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads: so.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, so, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0]
+        self.output = self.session.get_outputs()[0]
+
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.nc = len(ast.literal_eval(meta["names"])) if "names" in meta else 80
+        # 非动态导出的模型：batch / 尺寸固定
+        shape = self.input.shape
+        self.static_batch = shape[0] if isinstance(shape[0], int) else None
+        self.static_size = shape[2] if isinstance(shape[2], int) else None
+
+        self.imgsz = self.static_size or imgsz
+        self.conf, self.iou, self.classes = conf, iou, classes
+        self.bindings = {}
+
+    def _binding(self, batch, imgsz):
+        key = (batch, imgsz)
+        if key not in self.bindings:
+            n_anchors = sum((imgsz // s) ** 2 for s in (8, 16, 32))
+            in_buf = np.zeros((batch, 3, imgsz, imgsz), dtype=np.float32)
+            out_buf = np.zeros((batch, 4 + self.nc, n_anchors), dtype=np.float32)
+            canvas = np.empty((imgsz, imgsz, 3), dtype=np.uint8)
+            io = self.session.io_binding()
+            io.bind_ortvalue_input(self.input.name, self.ort.OrtValue.ortvalue_from_numpy(in_buf))
+            io.bind_ortvalue_output(self.output.name, self.ort.OrtValue.ortvalue_from_numpy(out_buf))
+            self.bindings[key] = (io, in_buf, out_buf, canvas)
+        return self.bindings[key]
+
+    def _run(self, images, imgsz):
+        io, in_buf, out_buf, canvas = self._binding(len(images), imgsz)
+        metas = []
+        for k, img in enumerate(images):
+            _, ratio, pad = letterbox(img, imgsz, out=canvas)
+            # HWC BGR uint8 -> CHW RGB float32 [0, 1]，直接写进绑定的输入缓冲
+            np.multiply(canvas.transpose(2, 0, 1)[::-1], 1.0 / 255, out=in_buf[k], casting="unsafe")
+            metas.append((ratio, pad, img.shape))
+        self.session.run_with_iobinding(io)
+        return [postprocess(out_buf[k], self.conf, self.iou, self.classes, *metas[k])
+                for k in range(len(images))]
+
+    def detect(self, images, imgsz=None):
+        images = list(images)
+        imgsz = self.static_size or imgsz or self.imgsz
+        if self.static_batch:
+            out = []
+            for i in range(0, len(images), self.static_batch):
+                chunk = images[i:i + self.static_batch]
+                # 固定 batch 的模型：不足的部分用第一张图补齐
+                padded = chunk + [chunk[0]] * (self.static_batch - len(chunk))
+                out.extend(self._run(padded, imgsz)[:len(chunk)])
+            return out
+        return self._run(images, imgsz)
+
+
+# ================= 模型准备 =================
+def ensure_onnx(weights="yolov8n.pt", imgsz=640):
+    """需要时用 ultralytics 导出动态 batch/尺寸的 ONNX (只导出一次)"""
+    onnx_path = os.path.splitext(weights)[0] + ".onnx"
+    if weights.endswith(".onnx") or os.path.exists(onnx_path):
+        return weights if weights.endswith(".onnx") else onnx_path
+    from ultralytics import YOLO
+    print(f"🔄 [Detector] Exporting {weights} -> ONNX")
+    return YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+
+
+def quantize_int8(onnx_path, calib_dir, imgsz=640, out_path=None):
+    """静态 INT8 量化 (QDQ)，需要一批代表性的路口截图作为校准集"""
+    import onnxruntime as ort
+    from onnxruntime.quantization import quantize_static, CalibrationDataReader, QuantFormat, QuantType
+
+    out_path = out_path or onnx_path.replace(".onnx", "_int8.onnx")
+    if os.path.exists(out_path): return out_path
+    paths = sorted(p for ext in ("*.jpg", "*.png") for p in glob.glob(os.path.join(calib_dir, ext)))
+    if not paths: raise FileNotFoundError(f"No calibration images in {calib_dir!r}")
+
+    input_name = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class CalibReader(CalibrationDataReader):
+        """校准数据：预处理与推理完全一致"""
+        def __init__(self):
+            self.paths = iter(paths)
+
+        def get_next(self):
+            for path in self.paths:
+                img = cv2.imread(path)
+                if img is None: continue
+                canvas, _, _ = letterbox(img, imgsz)
+                blob = canvas.transpose(2, 0, 1)[::-1][None].astype(np.float32) / 255
+                return {input_name: np.ascontiguousarray(blob)}
+            return None
+
+    reader = CalibReader()
+    print(f"🔄 [Detector] INT8 calibration on {len(paths)} images...")
+    quantize_static(onnx_path, out_path, reader, quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    return out_path
+
+
+def create_detector(backend=None, weights="yolov8n.pt", imgsz=640, conf=0.25, iou=0.7,
+                    classes=None, device=None, int8=None):
+    backend = backend or DETECTOR_BACKEND
+    if backend == "onnx":
+        onnx_path = ensure_onnx(weights, imgsz)
+        if ONNX_INT8 if int8 is None else int8:
+            try:
+                onnx_path = quantize_int8(onnx_path, ONNX_CALIB_DIR, imgsz)
+            except Exception as e:
+                print(f"⚠️ [Detector] INT8 unavailable ({e}), using FP32")
+        print(f"✅ [Detector] ONNX Runtime: {onnx_path}")
+        return OnnxDetector(onnx_path, imgsz=imgsz, conf=conf, iou=iou, classes=classes)
+    return UltralyticsDetector(weights, imgsz=imgsz, conf=conf, iou=iou, classes=classes, device=device)
+
+
+def warmup(detector, imgsz=640, batch=1):
+    """空图预热，消除首帧卡顿"""
+    try: detector.detect([np.zeros((imgsz, imgsz, 3), dtype=np.uint8)] * batch, imgsz=imgsz)
+    except: pass
+
+
+# ================= 后端对比测速 =================
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Detector backend benchmark")
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--imgsz", type=int, default=320)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--backends", default="ultralytics,onnx")
+    parser.add_argument("--int8", action="store_true")
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.video)
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = cap.read()
+        if not ret: break
+        frames.append(cv2.resize(frame, (640, 360)))
+
+    for name in args.backends.split(","):
+        det = create_detector(name, imgsz=args.imgsz, classes=[2, 3, 5, 7], int8=args.int8)
+        warmup(det, args.imgsz, args.batch)
+        n_boxes = 0
+        t0 = time.time()
+        for i in range(0, len(frames), args.batch):
+            n_boxes += sum(len(d) for d in det.detect(frames[i:i + args.batch], imgsz=args.imgsz))
+        dt = time.time() - t0
+        print(f"{name:12s} {len(frames) / dt:6.1f} FPS | {dt / len(frames) * 1000:6.1f} ms/frame | boxes={n_boxes}")
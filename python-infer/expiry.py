@@ -0,0 +1,45 @@
+# 按最后出现时间排序的过期表 (Expiry Table)
+# 每次刷新都把 key 移到队尾，队列天然按最后出现时间有序：
+# 过期清理只需从队头弹出已超时的项，摊还 O(1)，不再整表扫描；
+# 另设硬上限，繁忙路口目标数暴涨时直接淘汰最久未出现的项，内存有界。
+from collections import OrderedDict
+
+
+class ExpiringDict:
+    """key -> value，附带最后刷新时间；ttl 秒未刷新或超过 max_items 时淘汰最旧项"""
+    def __init__(self, ttl=10.0, max_items=1024):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.items = OrderedDict()   # key -> (last_seen, value)
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        item = self.items.get(key)
+        return item[1] if item is not None else default
+
+    def put(self, key, value, now):
+        """写入并刷新最后出现时间 (调用方需保证 now 单调不减)"""
+        self.items[key] = (now, value)
+        self.items.move_to_end(key)
+        if len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+            self.evicted += 1
+
+    def expire(self, now):
+        """弹出所有超时项，返回弹出的数量"""
+        items = self.items
+        deadline = now - self.ttl
+        n = 0
+        while items:
+            key, (seen, _) = next(iter(items.items()))
+            if seen >= deadline: break
+            items.popitem(last=False)
+            n += 1
+        self.evicted += n
+        return n
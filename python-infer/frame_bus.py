@@ -0,0 +1,108 @@
+# 共享内存帧总线 (Frame Bus)
+# 多槽环形缓冲 + 每槽序列号 (seqlock)：
+#   写端：seq 变奇数 -> 写像素/时间戳 -> seq 变偶数 -> 发布全局帧号
+#   读端：读前后两次 seq 一致且为偶数才算完整帧，否则重试
+# 单写多读，读端不加锁，也不会读到写了一半的画面。
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+# 头部: [最新帧号, 槽数, 保留, 保留]
+HEADER_FIELDS = 4
+
+
+class FrameRing:
+    """单路摄像头的多槽帧环 (一个 Worker 写，任意多个读者读)"""
+    def __init__(self, name, shape, slots=3, create=False):
+        self.name = name
+        self.shape = tuple(shape)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape))
+
+        header_bytes = HEADER_FIELDS * 8
+        meta_bytes = slots * 8 * 3  # seqlock 计数, 帧号, 时间戳
+        size = header_bytes + meta_bytes + slots * frame_bytes
+
+        if create:
+            try: shared_memory.SharedMemory(name=name).unlink()
+            except: pass
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        buf = self.shm.buf
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=buf, offset=0)
+        off = header_bytes
+        self.locks = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=off); off += slots * 8
+        self.frame_nos = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=off); off += slots * 8
+        self.stamps = np.ndarray((slots,), dtype=np.float64, buffer=buf, offset=off); off += slots * 8
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=buf, offset=off)
+
+        if create:
+            self.header[:] = 0
+            self.header[1] = slots
+            self.locks[:] = 0
+            self.frame_nos[:] = 0
+
+    # ---------- 写端 ----------
+    def begin_write(self):
+        """取得下一个槽的可写视图 (可直接在上面绘制)，必须配合 end_write 使用"""
+        seq = int(self.header[0]) + 1
+        slot = seq % self.slots
+        self.locks[slot] += 1  # 奇数：写入中
+        self._pending = (seq, slot)
+        return self.frames[slot]
+
+    def end_write(self, capture_ts=None):
+        seq, slot = self._pending
+        self.frame_nos[slot] = seq
+        self.stamps[slot] = time.time() if capture_ts is None else capture_ts
+        self.locks[slot] += 1  # 偶数：写入完成
+        self.header[0] = seq   # 最后发布帧号
+        return seq
+
+    def write(self, frame, capture_ts=None):
+        """拷贝一帧进环形缓冲，返回该帧序号"""
+        np.copyto(self.begin_write(), frame)
+        return self.end_write(capture_ts)
+
+    # ---------- 读端 ----------
+    def latest_seq(self):
+        return int(self.header[0])
+
+    def read_latest(self, out=None, retries=3):
+        """
+        读取最新一帧的完整拷贝。
+        返回 (seq, capture_ts, frame)，尚无帧或多次冲突时返回 None。
+        """
+        for _ in range(retries):
+            seq = int(self.header[0])
+            if seq == 0: return None
+            slot = seq % self.slots
+            before = int(self.locks[slot])
+            if before & 1: continue  # 写端正在覆盖该槽
+            if out is None: out = np.empty(self.shape, dtype=np.uint8)
+            np.copyto(out, self.frames[slot])
+            ts = float(self.stamps[slot])
+            frame_no = int(self.frame_nos[slot])
+            if int(self.locks[slot]) == before and frame_no == seq:
+                return seq, ts, out
+        return None
+
+    def wait_newer(self, last_seq, timeout=1.0, out=None, poll_interval=0.002):
+        """阻塞等待比 last_seq 更新的帧；超时返回 None"""
+        deadline = time.time() + timeout
+        while True:
+            if int(self.header[0]) > last_seq:
+                frame = self.read_latest(out=out)
+                if frame is not None: return frame
+            if time.time() >= deadline: return None
+            time.sleep(poll_interval)
+
+    def close(self):
+        self.header = self.locks = self.frame_nos = self.stamps = self.frames = None
+        self.shm.close()
+
+    def unlink(self):
+        try: self.shm.unlink()
+        except: pass
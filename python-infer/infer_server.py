@@ -0,0 +1,134 @@
+# 单进程批量推理服务 (Inference Server)
+# Worker 进程只负责读视频/画图，把待检测帧写进共享内存槽；
+# 推理进程一次收集所有就绪的摄像头帧，跑一次批量前向，
+# 再按摄像头分别推进各自的 ByteTrack，把结果写回共享内存。
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+from tracking import create_tracker, update_tracker, TRACK_CONF
+from detector import create_detector, warmup
+
+# 槽状态
+SLOT_IDLE, SLOT_REQUEST, SLOT_DONE = 0, 1, 2
+# 头部字段: state, seq, n_tracks, reserved
+HEADER_FIELDS = 4
+MAX_TRACKS = 128
+# 每条结果: x1, y1, x2, y2, track_id, cls
+RESULT_COLS = 6
+
+
+class InferenceSlot:
+    """单路摄像头的共享内存请求/结果槽"""
+    def __init__(self, name, frame_shape, create=False):
+        self.name = name
+        self.frame_shape = tuple(frame_shape)
+        header_bytes = HEADER_FIELDS * 8
+        frame_bytes = int(np.prod(self.frame_shape))
+        result_bytes = MAX_TRACKS * RESULT_COLS * 4
+        size = header_bytes + frame_bytes + result_bytes
+
+        if create:
+            try: shared_memory.SharedMemory(name=name).unlink()
+            except: pass
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        buf = self.shm.buf
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=buf, offset=0)
+        self.frame = np.ndarray(self.frame_shape, dtype=np.uint8, buffer=buf, offset=header_bytes)
+        self.result = np.ndarray((MAX_TRACKS, RESULT_COLS), dtype=np.float32, buffer=buf,
+                                 offset=header_bytes + frame_bytes)
+        if create: self.header[:] = 0
+
+    def close(self):
+        # 先释放 numpy 视图，否则 SharedMemory.close 会报 BufferError
+        self.header = self.frame = self.result = None
+        self.shm.close()
+
+    def unlink(self):
+        try: self.shm.unlink()
+        except: pass
+
+
+class InferenceClient:
+    """Worker 侧：提交一帧并等待该路摄像头的跟踪结果"""
+    def __init__(self, slot_name, frame_shape, request_event, done_event, timeout=1.0):
+        self.slot = InferenceSlot(slot_name, frame_shape)
+        self.request_event = request_event
+        self.done_event = done_event
+        self.timeout = timeout
+
+    def track(self, frame):
+        """
+        返回 (N, 6) 的 float32 数组 [x1, y1, x2, y2, track_id, cls]；
+        推理服务超时未响应时返回 None，调用方沿用上一次的结果。
+        """
+        slot = self.slot
+        # 上一个请求还没被处理 (服务超时)，不覆盖正在使用的帧
+        if slot.header[0] == SLOT_REQUEST:
+            if not self.done_event.wait(self.timeout): return None
+        self.done_event.clear()
+        np.copyto(slot.frame, frame)
+        slot.header[1] += 1
+        slot.header[0] = SLOT_REQUEST
+        self.request_event.set()
+
+        if not self.done_event.wait(self.timeout): return None
+        n = int(slot.header[2])
+        return slot.result[:n].copy()
+
+
+def inference_server_process(slot_names, frame_shape, request_event, done_events, cfg, ready_event=None):
+    """
+    推理进程主循环。
+    cfg: {"model": 权重路径, "imgsz": 推理分辨率, "classes": 类别, "batch_window": 聚合窗口(秒),
+          "conf": 置信度阈值 (默认 TRACK_CONF，与各 worker 原 model.track 一致),
+          "backend": "ultralytics" / "onnx" (默认读 DETECTOR_BACKEND)}
+    ready_event: 模型加载并完成一次整批预热推理后 set
+    """
+    imgsz = cfg.get("imgsz", 320)
+    classes = cfg.get("classes")
+    conf = cfg.get("conf", TRACK_CONF)
+    batch_window = cfg.get("batch_window", 0.005)
+
+    slots = [InferenceSlot(name, frame_shape) for name in slot_names]
+    print("Inference Server: Loading detector...", end="", flush=True)
+    detector = create_detector(cfg.get("backend"), weights=cfg.get("model", "yolov8n.pt"),
+                               imgsz=imgsz, conf=conf, classes=classes)
+    # 每路摄像头独立的跟踪器状态
+    trackers = [create_tracker() for _ in slots]
+    # 按满批预热，首个真实请求不再承担初始化开销
+    warmup(detector, imgsz, batch=len(slots))
+    print(f"Done. Serving {len(slots)} cameras.")
+    if ready_event is not None: ready_event.set()
+
+    while True:
+        if not request_event.wait(timeout=1.0): continue
+        # 短暂聚合，让其他摄像头的帧也赶上这一批
+        if batch_window > 0: time.sleep(batch_window)
+        request_event.clear()
+
+        ready = [i for i, s in enumerate(slots) if s.header[0] == SLOT_REQUEST]
+        if not ready: continue
+
+        frames = [slots[i].frame for i in ready]
+        try:
+            results = detector.detect(frames, imgsz=imgsz)
+        except Exception as e:
+            print(f"Inference Error: {e}")
+            results = [None] * len(ready)
+
+        for i, res in zip(ready, results):
+            slot = slots[i]
+            n = 0
+            if res is not None:
+                tracks = update_tracker(trackers[i], res, slot.frame)
+                n = min(len(tracks), MAX_TRACKS)
+                if n:
+                    slot.result[:n, :5] = tracks[:n, :5]
+                    slot.result[:n, 5] = tracks[:n, 6]
+            slot.header[2] = n
+            slot.header[0] = SLOT_DONE
+            done_events[i].set()
@@ -5,14 +5,21 @@ os.environ["OPENCV_LOG_LEVEL"] = "0"
 
 import cv2
 import time
-import math
 import psutil
 import numpy as np
 import multiprocessing as mp
-from multiprocessing import shared_memory
-from flask import Flask, Response, render_template_string
-from ultralytics import YOLO
-import hyperlpr3 # 引入车牌识别库
+from flask import Flask, Response, render_template_string, jsonify
+from detector import create_detector, warmup, DETECTOR_BACKEND
+from tracking import create_tracker, update_tracker, TRACK_CONF
+from infer_server import InferenceSlot, InferenceClient, inference_server_process
+from lpr_service import LprRequestRing, LprClient, lpr_service_process
+from frame_bus import FrameRing
+from capture import VideoReader
+from track_store import TrackStore
+from render_cache import TintBand, PatchCache
+from mjpeg_hub import MjpegHub, MJPEG_MIMETYPE
+from startup import use_warm_start, ReadyBarrier
+from stage_metrics import StageHistograms, StageClock
 
 # ================= 1. Configuration =================
 # 视频路径配置
@@ -36,6 +43,19 @@ AI_SKIP_FRAMES = 3
 YOLO_IMG_SIZE = 320      
 # 视频读取跳帧：为了加快播放速度，每读1帧，跳过N帧不处理 (物理加速)
 VIDEO_READ_SKIP = 2      
+# 播放倍速：按视频时间戳节拍，跳帧后仍以原始帧率出图
+PLAYBACK_SPEED = VIDEO_READ_SKIP + 1
+# 推理服务模式：4路共用一个 YOLO 进程做批量推理 (False 则每个 Worker 各自加载模型)
+INFER_SERVER_MODE = True
+# 批量聚合窗口 (秒)：等待其他摄像头帧凑成一批
+INFER_BATCH_WINDOW = 0.005
+VEHICLE_CLASSES = [2, 3, 5, 7]
+# LPR 服务：每路摄像头在共享请求环里占用的槽数
+LPR_SLOTS_PER_CAM = 2
+# 启动时等待所有进程就绪的最长时间 (秒)，超时后仍启动 Web 服务并报告未就绪组件
+READY_TIMEOUT = 120
+# 分阶段延迟直方图 (共享内存)，通过 /metrics 查看
+STATS_SHM_NAME = "psm_stage_stats"
 
 PIXELS_PER_METER = 20    # 虚拟标定
 LINE_POS_RATIO = 0.6     # 检测线位置比例
@@ -49,96 +69,100 @@ NEON_COLORS = [
 # 仪表盘高度
 LOG_AREA_H = 100 
 TOTAL_H = FRAME_H + LOG_AREA_H
-TOTAL_SHM_SIZE = FRAME_W * TOTAL_H * 3
+# 帧环槽数：写端永远写下一个槽，读端有足够时间拷走上一帧
+FRAME_RING_SLOTS = 3
 
 # ================= 2. Traffic Analyst (算法核心+LPR) =================
 class TrafficAnalyst:
     def __init__(self):
-        self.track_history = {} 
+        # 轨迹存在预分配的环形缓冲里，最多保留最近 5 个点
+        self.store = TrackStore(history=5)
         self.speeds = {}        
         self.line_y = int(FRAME_H * LINE_POS_RATIO)
         self.logs = []
+        self.log_entries = []     # [obj_id, 日志前缀, 车牌]，车牌结果异步回填
+        self.plates = {}          # 已返回识别结果的 track
         self.latest_plate = "--"
         self.triggered_frames = 0 # 用于控制线的变色状态
+
+    def _add_log(self, obj_id, prefix, plate):
+        if self.log_entries and self.log_entries[-1][1:] == [prefix, plate]: return
+        self.log_entries.append([obj_id, prefix, plate])
+        if len(self.log_entries) > 4: self.log_entries.pop(0)
+        self.logs[:] = [f"{p} LPR:{t}" for _, p, t in self.log_entries]
+
+    def merge_plates(self, results):
+        """合并 LPR 服务返回的结果，有变化时返回 True"""
+        changed = False
+        for obj_id, text, conf in results:
+            plate_text = "Unknown"
+            # 简单过滤置信度过低的结果
+            if text and (conf > 0.75 or len(text) > 6):
+                plate_text = text
+                self.latest_plate = plate_text
+            if obj_id in self.store.slot_of: self.plates[obj_id] = plate_text
+            for entry in self.log_entries:
+                if entry[0] == obj_id and entry[2] == "...":
+                    entry[2] = plate_text
+            changed = True
+        if changed:
+            self.logs[:] = [f"{p} LPR:{t}" for _, p, t in self.log_entries]
+        return changed
         
-    def update(self, tracks, frame, lpr_instance):
+    def update(self, boxes, ids, frame, lpr_client):
         current_time = time.time()
-        current_ids = []
         
         # 线的触发状态递减
         if self.triggered_frames > 0: self.triggered_frames -= 1
 
         # 1. 计算拥堵指数
-        congestion = min(10.0, (len(tracks) / 15.0) * 10)
+        congestion = min(10.0, (len(ids) / 15.0) * 10)
         status = "FREE"
         if congestion > 7: status = "JAM"
         elif congestion > 4: status = "BUSY"
 
-        for box in tracks:
-            if len(box) < 5: continue
-            x1, y1, x2, y2, obj_id = map(int, box[:5])
-            cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
-            current_ids.append(obj_id)
-            
-            # 记录轨迹
-            if obj_id not in self.track_history:
-                self.track_history[obj_id] = []
-            self.track_history[obj_id].append((cx, cy, current_time))
-            if len(self.track_history[obj_id]) > 5: self.track_history[obj_id].pop(0)
+        # 记录轨迹 (所有车辆一次写入)
+        boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        ids = np.asarray(ids, dtype=np.int64)
+        centers = np.stack([(boxes[:, 0] + boxes[:, 2]) // 2, (boxes[:, 1] + boxes[:, 3]) // 2], axis=1)
+        slots = self.store.push(ids, centers, current_time)
+
+        # 2. 速度估算 (向量化)
+        # 注意：如果视频加速播放，计算出的速度会比实际快
+        self.store.update_speeds(slots, PIXELS_PER_METER, min_samples=3, min_dt=0.01)
+        spd_ids, spd_vals = self.store.speeds_of(slots)
+        self.speeds = dict(zip(spd_ids.tolist(), spd_vals.tolist()))
+
+        # 3. 过线检测 + LPR触发 (只遍历过线的车辆)
+        directions = self.store.crossings(slots, self.line_y)
+        for k in np.flatnonzero(directions):
+            x1, y1, x2, y2 = boxes[k].tolist()
+            obj_id = int(ids[k])
+            direction = "Down" if directions[k] > 0 else "Up"
+            self.triggered_frames = 10 # 触发状态持续10帧
             
-            # 2. 速度估算
-            if len(self.track_history[obj_id]) >= 3:
-                last_pt = self.track_history[obj_id][-1]
-                prev_pt = self.track_history[obj_id][0]
-                dist_px = math.sqrt((last_pt[0] - prev_pt[0])**2 + (last_pt[1] - prev_pt[1])**2)
-                time_diff = last_pt[2] - prev_pt[2]
-                if time_diff > 0.01:
-                    # 注意：如果视频加速播放，计算出的速度会比实际快
-                    speed_kmh = (dist_px / PIXELS_PER_METER) / time_diff * 3.6
-                    self.speeds[obj_id] = int(speed_kmh)
-
-            # 3. 过线检测 + LPR触发
-            prev_y = self.track_history[obj_id][0][1] if len(self.track_history[obj_id]) > 0 else cy
-            direction = None
-            if prev_y < self.line_y and cy >= self.line_y: direction = "Down"
-            elif prev_y > self.line_y and cy <= self.line_y: direction = "Up"
+            # === LPR 核心逻辑：仅在过线瞬间提交给 LPR 服务，不阻塞本路渲染 ===
+            plate_text = "Unknown"
+            # 稍微扩大裁剪范围，提高识别率
+            pad = 5
+            crop_x1, crop_y1 = max(0, x1-pad), max(0, y1-pad)
+            crop_x2, crop_y2 = min(FRAME_W, x2+pad), min(FRAME_H, y2+pad)
+            vehicle_crop = frame[crop_y1:crop_y2, crop_x1:crop_x2]
             
-            if direction:
-                self.triggered_frames = 10 # 触发状态持续10帧
-                
-                # === LPR 核心逻辑：仅在过线瞬间识别 ===
-                plate_text = "Unknown"
-                # 稍微扩大裁剪范围，提高识别率
-                pad = 5
-                crop_x1, crop_y1 = max(0, x1-pad), max(0, y1-pad)
-                crop_x2, crop_y2 = min(FRAME_W, x2+pad), min(FRAME_H, y2+pad)
-                vehicle_crop = frame[crop_y1:crop_y2, crop_x1:crop_x2]
-                
-                if vehicle_crop.size > 0 and vehicle_crop.shape[0] > 20:
-                    try:
-                        # HyperLPR 识别
-                        res = lpr_instance(vehicle_crop)
-                        if res:
-                            text, conf, _ = res[0]
-                            # 简单过滤置信度过低的结果
-                            if conf > 0.75 or len(text) > 6:
-                                plate_text = text
-                                self.latest_plate = plate_text
-                    except: pass
-                # ====================================
-
-                # 生成日志
-                spd = self.speeds.get(obj_id, 0)
-                log = f"ID:{obj_id} {direction} Spd:{spd} LPR:{plate_text}"
-                if not self.logs or self.logs[-1] != log: 
-                    self.logs.append(log)
-                    if len(self.logs) > 4: self.logs.pop(0)
-
-        # 清理
-        valid_keys = set(current_ids)
-        self.track_history = {k:v for k,v in self.track_history.items() if k in valid_keys}
-        self.speeds = {k:v for k,v in self.speeds.items() if k in valid_keys}
-        avg_speed = int(sum(self.speeds.values()) / len(self.speeds)) if self.speeds else 0
+            if lpr_client is not None and vehicle_crop.size > 0 and vehicle_crop.shape[0] > 20:
+                # 结果未返回前先显示 "..."，到达后由 merge_plates 回填
+                if lpr_client.submit(obj_id, vehicle_crop):
+                    plate_text = self.plates.get(obj_id, "...")
+            # ====================================
+
+            # 生成日志
+            spd = self.speeds.get(obj_id, 0)
+            self._add_log(obj_id, f"ID:{obj_id} {direction} Spd:{spd}", plate_text)
+
+        # 清理本帧未出现的轨迹
+        for obj_id in self.store.evict_stale():
+            self.plates.pop(obj_id, None)
+        avg_speed = int(spd_vals.mean()) if len(spd_vals) else 0
             
         return {
             "idx": congestion, "status": status, "avg_spd": avg_speed,
@@ -147,75 +171,121 @@ class TrafficAnalyst:
         }
 
 # ================= 3. UI 绘制 (新需求实现) =================
-def draw_dashboard(frame, cam_id, metrics, cpu_load, fps):
-    canvas = np.zeros((TOTAL_H, FRAME_W, 3), dtype=np.uint8)
-    canvas[:FRAME_H, :FRAME_W] = frame 
-    
-    line_y = int(FRAME_H * LINE_POS_RATIO)
-    overlay = canvas.copy()
-    
-    # === 新需求：线上方蓝色，线下方玫粉色，半透明 ===
-    # 上方蓝色 (Blue-ish)
-    cv2.rectangle(overlay, (0, line_y-30), (FRAME_W, line_y), (255, 100, 0), -1) 
-    # 下方玫粉色 (Magenta-ish)
-    cv2.rectangle(overlay, (0, line_y), (FRAME_W, line_y+30), (180, 105, 255), -1) 
-    # 应用半透明
-    cv2.addWeighted(overlay, 0.4, canvas, 0.6, 0, canvas)
-    
-    # === 新需求：中间线平时黄色，通过变白色 ===
-    line_color = (255, 255, 255) if metrics['triggered'] else (0, 255, 255)
-    cv2.line(canvas, (0, line_y), (FRAME_W, line_y), line_color, 2)
-
-    # 左上角状态面板
-    cv2.rectangle(canvas, (5, 5), (220, 110), (20, 20, 20), -1)
-    cv2.rectangle(canvas, (5, 5), (220, 110), (0, 255, 255), 1)
-    
-    cv2.putText(canvas, f"{cam_id} | CPU: {cpu_load}%", (15, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-    
-    status_color = (0, 255, 0)
-    if metrics['idx'] > 7: status_color = (0, 0, 255)
-    elif metrics['idx'] > 4: status_color = (0, 165, 255)
-    
-    cv2.putText(canvas, f"Status: {metrics['status']} (Idx:{metrics['idx']:.1f})", (15, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.5, status_color, 1)
-    cv2.putText(canvas, f"Avg Spd: {metrics['avg_spd']} km/h", (15, 75), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
-    # 显示最近识别的车牌
-    cv2.putText(canvas, f"LPR: {metrics['plate']}", (15, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 255), 2)
-    
-    # FPS
-    cv2.putText(canvas, f"FPS: {fps}", (FRAME_W - 80, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
-
-    # 底部日志区
-    log_y = FRAME_H + 20
-    cv2.putText(canvas, "EVENT LOGS & LPR:", (10, log_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
-    for i, log in enumerate(reversed(metrics['logs'])):
-        if i >= 3: break 
-        # 由于OpenCV不支持中文，HyperLPR识别出的中文首字可能会显示为问号，这是正常的
-        cv2.putText(canvas, log, (130, log_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
-        log_y += 20
-
-    return canvas
+class DashboardRenderer:
+    """
+    仪表盘渲染器：色带、面板底图、日志标签只生成一次，
+    每帧只混合线附近的两条色带，面板和日志区在文字变化时才重绘，输出缓冲复用。
+    """
+    def __init__(self, cam_id):
+        self.cam_id = cam_id
+        self.canvas = np.zeros((TOTAL_H, FRAME_W, 3), dtype=np.uint8)
+        self.frame_view = self.canvas[:FRAME_H]
+        self.line_y = int(FRAME_H * LINE_POS_RATIO)
+        line_y = self.line_y
+
+        # === 新需求：线上方蓝色，线下方玫粉色，半透明 (只混合这两条 ROI) ===
+        self.bands = [
+            TintBand((0, line_y - 30, FRAME_W, line_y), (255, 100, 0), 0.4),      # 上方蓝色 (Blue-ish)
+            TintBand((0, line_y, FRAME_W, line_y + 31), (180, 105, 255), 0.4),    # 下方玫粉色 (Magenta-ish)
+        ]
+
+        # 左上角状态面板底图 (不透明，覆盖画面)
+        self.panel_rect = (5, 5, 221, 111)
+        px1, py1, px2, py2 = self.panel_rect
+        self.panel_bg = np.zeros((py2 - py1, px2 - px1, 3), dtype=np.uint8)
+        cv2.rectangle(self.panel_bg, (0, 0), (px2 - px1 - 1, py2 - py1 - 1), (20, 20, 20), -1)
+        cv2.rectangle(self.panel_bg, (0, 0), (px2 - px1 - 1, py2 - py1 - 1), (0, 255, 255), 1)
+        self.panels = PatchCache(maxsize=8)
+
+        # 底部日志区底图
+        self.log_bg = np.zeros((LOG_AREA_H, FRAME_W, 3), dtype=np.uint8)
+        cv2.putText(self.log_bg, "EVENT LOGS & LPR:", (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+        self.log_key = None
+        self.canvas[FRAME_H:] = self.log_bg
+
+    def _render_panel(self, cpu_load, status, idx, avg_spd, plate):
+        panel = self.panel_bg.copy()
+        ox, oy = self.panel_rect[:2]
+        def put(text, x, y, scale, color, thickness=1):
+            cv2.putText(panel, text, (x - ox, y - oy), cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness)
+
+        put(f"{self.cam_id} | CPU: {cpu_load}%", 15, 25, 0.6, (255, 255, 255))
+        status_color = (0, 255, 0)
+        if idx > 7: status_color = (0, 0, 255)
+        elif idx > 4: status_color = (0, 165, 255)
+        put(f"Status: {status} (Idx:{idx:.1f})", 15, 50, 0.5, status_color)
+        put(f"Avg Spd: {avg_spd} km/h", 15, 75, 0.5, (255, 255, 0))
+        # 显示最近识别的车牌
+        put(f"LPR: {plate}", 15, 100, 0.6, (255, 0, 255), 2)
+        return panel
+
+    def render(self, frame, metrics, cpu_load, fps):
+        canvas = self.canvas
+        np.copyto(self.frame_view, frame)
+        for band in self.bands: band.apply(canvas)
+
+        # === 新需求：中间线平时黄色，通过变白色 ===
+        line_color = (255, 255, 255) if metrics['triggered'] else (0, 255, 255)
+        cv2.line(canvas, (0, self.line_y), (FRAME_W, self.line_y), line_color, 2)
+
+        # 面板内容不变时直接拷贝缓存的像素块
+        key = (cpu_load, metrics['status'], round(metrics['idx'], 1), metrics['avg_spd'], metrics['plate'])
+        panel = self.panels.get(key, lambda: self._render_panel(*key))
+        px1, py1, px2, py2 = self.panel_rect
+        canvas[py1:py2, px1:px2] = panel
+
+        # FPS
+        cv2.putText(canvas, f"FPS: {fps}", (FRAME_W - 80, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
+
+        # 底部日志区：不被画面覆盖，只在日志变化时重绘
+        logs = tuple(metrics['logs'][-3:])
+        if logs != self.log_key:
+            self.log_key = logs
+            log_area = canvas[FRAME_H:]
+            np.copyto(log_area, self.log_bg)
+            log_y = 20
+            for log in reversed(logs):
+                # 由于OpenCV不支持中文，HyperLPR识别出的中文首字可能会显示为问号，这是正常的
+                cv2.putText(log_area, log, (130, log_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
+                log_y += 20
+
+        return canvas
 
 # ================= 4. Worker 进程 (极速版) =================
-def worker_process(index, video_path, shm_name):
+def worker_process(index, video_path, shm_name, infer_args=None, lpr_args=None, ready_event=None,
+                   stats_name=None):
     try:
-        existing_shm = shared_memory.SharedMemory(name=shm_name)
-        shared_frame = np.ndarray((TOTAL_H, FRAME_W, 3), dtype=np.uint8, buffer=existing_shm.buf)
+        ring = FrameRing(shm_name, (TOTAL_H, FRAME_W, 3), slots=FRAME_RING_SLOTS)
+        stats = StageHistograms(stats_name, 4) if stats_name else None
     except Exception as e:
         print(f"SHM Error: {e}")
         return
 
-    # 初始化模型
-    print(f"Worker {index}: Loading YOLO...", end="", flush=True)
-    model = YOLO("yolov8n.pt")
-    print("Done. Loading LPR...", end="", flush=True)
-    lpr = hyperlpr3.LicensePlateCatcher()
+    # 初始化模型：推理服务模式下只连接共享推理槽，不在本进程加载 YOLO
+    detector, tracker, client = None, None, None
+    if infer_args is not None:
+        client = InferenceClient(*infer_args)
+        print(f"Worker {index}: Using inference server...", end="", flush=True)
+    else:
+        print(f"Worker {index}: Loading detector...", end="", flush=True)
+        detector = create_detector(weights="yolov8n.pt", imgsz=YOLO_IMG_SIZE, conf=TRACK_CONF,
+                                   classes=VEHICLE_CLASSES)
+        tracker = create_tracker()
+        warmup(detector, YOLO_IMG_SIZE)
+    # 车牌识别统一交给 LPR 服务进程 (未传 lpr_args 时不做车牌识别)
+    lpr_client = LprClient(*lpr_args) if lpr_args is not None else None
     print("Done.")
     
     analyst = TrafficAnalyst()
-    cap = cv2.VideoCapture(video_path)
+    # 解码在独立线程中进行，推理循环只取最新帧
+    reader = VideoReader(video_path, size=(FRAME_W, FRAME_H), skip=VIDEO_READ_SKIP, speed=PLAYBACK_SPEED,
+                         timer=stats.recorder(index) if stats is not None else None).start()
+    clock = StageClock(stats, index)
+    last_seq = 0
     proc = psutil.Process(os.getpid()) 
     
     cam_id = f"CAM-{index+1:02d}"
+    renderer = DashboardRenderer(cam_id)
     frame_cnt = 0
     fps_start = time.time()
     real_fps = 0
@@ -225,40 +295,44 @@ def worker_process(index, video_path, shm_name):
     metrics = {"idx": 0, "status": "INIT", "avg_spd": 0, "speeds": {}, "logs": [], "plate": "--", "triggered": False}
     
     while True:
-        # === 极速优化：物理跳帧 ===
-        # 连续读取并丢弃几帧，加快视频播放进度，减少解码压力
-        for _ in range(VIDEO_READ_SKIP):
-            cap.read()
-            
-        ret, frame = cap.read()
-        if not ret:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            continue
-
-        frame = cv2.resize(frame, (FRAME_W, FRAME_H))
+        # === 极速优化：物理跳帧 (读取线程里 grab 跳过，不解码) ===
+        got = reader.wait_newer(last_seq, timeout=1.0)
+        if got is None: continue
+        last_seq, capture_ts, frame = got
         frame_cnt += 1
+        clock.start()
         
         # === 核心处理 (稀疏执行) ===
         if frame_cnt % AI_SKIP_FRAMES == 0:
-            # 1. AI 推理
-            results = model.track(frame, persist=True, verbose=False, 
-                                classes=[2, 3, 5, 7], tracker="bytetrack.yaml", imgsz=YOLO_IMG_SIZE)
+            # 1. AI 推理 (批量推理服务 或 本地模型)
+            boxes, ids = None, None
+            if client is not None:
+                tracks = client.track(frame)
+                if tracks is not None and len(tracks) > 0:
+                    boxes = tracks[:, :4].astype(int)
+                    ids = tracks[:, 4].astype(int)
+            else:
+                tracks = update_tracker(tracker, detector.detect([frame])[0], frame)
+                if len(tracks) > 0:
+                    boxes = tracks[:, :4].astype(int)
+                    ids = tracks[:, 4].astype(int)
+            clock.lap("track")
             
-            if results[0].boxes.id is not None:
-                boxes = results[0].boxes.xyxy.cpu().numpy().astype(int)
-                ids = results[0].boxes.id.cpu().numpy().astype(int)
-                
-                track_data = []
-                for b, i in zip(boxes, ids):
-                    track_data.append([b[0], b[1], b[2], b[3], i])
-                
+            if boxes is not None:
                 # 2. 算法更新 (传入原图用于LPR)
-                metrics = analyst.update(track_data, frame, lpr)
+                metrics = analyst.update(boxes, ids, frame, lpr_client)
                 cached_boxes = boxes
                 cached_ids = ids
+                clock.lap("analyst")
             else:
                 cached_boxes = []
 
+        # 合并 LPR 服务异步返回的车牌 (日志与 metrics['logs'] 是同一个列表)
+        plate_results = lpr_client.poll() if lpr_client is not None else None
+        if plate_results and analyst.merge_plates(plate_results):
+            metrics["plate"] = analyst.latest_plate
+        clock.start()
+
         # === 绘制车辆框 (每帧) - 新需求：自身对应颜色的框 ===
         for box, obj_id in zip(cached_boxes, cached_ids):
             x1, y1, x2, y2 = box
@@ -277,12 +351,15 @@ def worker_process(index, video_path, shm_name):
             fps_start = time.time()
             
         cpu_load = int(proc.cpu_percent())
-        final_canvas = draw_dashboard(frame, cam_id, metrics, cpu_load, real_fps)
+        final_canvas = renderer.render(frame, metrics, cpu_load, real_fps)
+        clock.lap("draw")
 
-        # 写入共享内存
-        np.copyto(shared_frame, final_canvas)
-        # 极速模式下减少休眠时间
-        time.sleep(0.005)
+        # 写入共享内存帧环 (带序号和采集时间戳)
+        ring.write(final_canvas, capture_ts)
+        clock.lap("shm_copy")
+        if stats is not None: stats.record(index, "e2e", time.time() - capture_ts)
+        # 第一帧画面已可供 Web 读取，即视为就绪
+        if ready_event is not None and not ready_event.is_set(): ready_event.set()
 
 # ================= 5. Flask App =================
 app = Flask(__name__)
@@ -321,55 +398,106 @@ HTML_TEMPLATE = """
 def index():
     return render_template_string(HTML_TEMPLATE)
 
-def generate_feed(index):
-    shm_name = f"psm_cam_{index}"
-    try:
-        existing_shm = shared_memory.SharedMemory(name=shm_name)
-        shm_view = np.ndarray((TOTAL_H, FRAME_W, 3), dtype=np.uint8, buffer=existing_shm.buf)
-    except: return
+def open_frame_ring(index):
+    try: return FrameRing(f"psm_cam_{index}", (TOTAL_H, FRAME_W, 3), slots=FRAME_RING_SLOTS)
+    except: return None
 
-    while True:
-        # 降低JPEG质量以提高网络传输速度
-        ret, buffer = cv2.imencode('.jpg', shm_view, [cv2.IMWRITE_JPEG_QUALITY, 70])
-        yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-        # 提高推流帧率上限
-        time.sleep(0.03) 
+# 每路只编码一次，所有浏览器连接共享同一份 JPEG
+FEED_HUB = MjpegHub(open_frame_ring, quality=70)
 
 @app.route('/video_feed/<int:cam_id>')
 def video_feed(cam_id):
-    return Response(generate_feed(cam_id), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(FEED_HUB.stream(cam_id), mimetype=MJPEG_MIMETYPE)
+
+_STAGE_STATS = []
+
+@app.route('/metrics')
+def get_metrics():
+    """各摄像头各阶段的延迟分位数 (p50/p95/p99, ms)"""
+    if not _STAGE_STATS:
+        try: _STAGE_STATS.append(StageHistograms(STATS_SHM_NAME, 4))
+        except: return jsonify({"error": "stage stats not available"}), 503
+    return jsonify(_STAGE_STATS[0].snapshot([f"CAM-{i+1:02d}" for i in range(4)]))
 
 # ================= 6. Main =================
 if __name__ == '__main__':
-    mp.set_start_method('spawn', force=True)
+    # 热启动：forkserver 预加载本模块及 numpy/cv2/检测器，子进程不再各自冷导入；
+    # 非推理服务模式下每个 Worker 都要加载 torch，一并预导入 ultralytics
+    preload = ["__main__", "numpy", "cv2", "detector", "tracking"]
+    if not INFER_SERVER_MODE and DETECTOR_BACKEND == "ultralytics": preload.append("ultralytics")
+    start_method = use_warm_start(preload)
+    print(f"⚙️ Start method: {start_method}")
+    barrier = ReadyBarrier()
+    stage_stats = StageHistograms(STATS_SHM_NAME, 4, create=True)
     
     if not os.path.exists(VIDEOS[0]):
         print(f"❌ Error: Videos not found in {VIDEO_DIR}")
         exit()
 
-    shm_handlers = []
-    for i in range(4):
-        try: shared_memory.SharedMemory(name=f"psm_cam_{i}").unlink()
-        except: pass
-        shm = shared_memory.SharedMemory(name=f"psm_cam_{i}", create=True, size=TOTAL_SHM_SIZE)
-        shm_handlers.append(shm)
+    frame_rings = [FrameRing(f"psm_cam_{i}", (TOTAL_H, FRAME_W, 3), slots=FRAME_RING_SLOTS, create=True)
+                   for i in range(4)]
 
+    # 推理服务：每路一个共享内存请求槽 + 一个完成事件
+    infer_slots = []
+    request_event = mp.Event()
+    done_events = [mp.Event() for _ in range(4)]
     processes = []
+    if INFER_SERVER_MODE:
+        slot_names = [f"psm_infer_{i}" for i in range(4)]
+        infer_slots = [InferenceSlot(name, (FRAME_H, FRAME_W, 3), create=True) for name in slot_names]
+        infer_cfg = {"model": "yolov8n.pt", "imgsz": YOLO_IMG_SIZE, "backend": DETECTOR_BACKEND,
+                     "conf": TRACK_CONF, "classes": VEHICLE_CLASSES, "batch_window": INFER_BATCH_WINDOW}
+        p = mp.Process(target=inference_server_process,
+                       args=(slot_names, (FRAME_H, FRAME_W, 3), request_event, done_events, infer_cfg,
+                             barrier.event("Inference Server")))
+        p.daemon = True
+        p.start()
+        barrier.watch("Inference Server", p)
+        processes.append(p)
+        print("🚀 Inference Server starting...")
+
+    # LPR 服务：共享请求环 + 每路一个结果队列
+    lpr_shape = (FRAME_H, FRAME_W, 3)
+    lpr_ring = LprRequestRing("psm_lpr", 4, LPR_SLOTS_PER_CAM, lpr_shape, create=True)
+    lpr_event = mp.Event()
+    lpr_queues = [mp.Queue(maxsize=64) for _ in range(4)]
+    p = mp.Process(target=lpr_service_process,
+                   args=("psm_lpr", 4, LPR_SLOTS_PER_CAM, lpr_shape, lpr_event, lpr_queues,
+                         barrier.event("LPR Service"), STATS_SHM_NAME))
+    p.daemon = True
+    p.start()
+    barrier.watch("LPR Service", p)
+    processes.append(p)
+    print("🚀 LPR Service starting...")
+
     for i in range(4):
-        p = mp.Process(target=worker_process, args=(i, VIDEOS[i], f"psm_cam_{i}"))
+        infer_args = None
+        if INFER_SERVER_MODE:
+            infer_args = (f"psm_infer_{i}", (FRAME_H, FRAME_W, 3), request_event, done_events[i])
+        lpr_args = ("psm_lpr", i, 4, LPR_SLOTS_PER_CAM, lpr_shape, lpr_event, lpr_queues[i])
+        name = f"Worker {i+1}"
+        p = mp.Process(target=worker_process,
+                       args=(i, VIDEOS[i], f"psm_cam_{i}", infer_args, lpr_args, barrier.event(name),
+                             STATS_SHM_NAME))
         p.daemon = True
         p.start()
+        barrier.watch(name, p)
         processes.append(p)
         print(f"🚀 Worker {i+1} starting...")
 
-    # 等待所有进程初始化模型完毕后再启动Web服务
-    time.sleep(10) 
+    # 等待所有进程加载模型并完成预热后再启动Web服务 (按实际耗时，不再固定 sleep)
+    t_ready = time.time()
+    not_ready = barrier.wait(timeout=READY_TIMEOUT)
+    print(f"⏱️ Startup took {time.time() - t_ready:.1f}s" + (f" ({len(not_ready)} not ready)" if not_ready else ""))
     
     try:
         print("✅ Web Server Running on http://<PI_IP>:5000")
         # 使用多线程模式运行Flask
         app.run(host='0.0.0.0', port=5000, threaded=True, use_reloader=False)
     finally:
-        for shm in shm_handlers: 
-            try: shm.unlink()
-            except: pass
+        for ring in frame_rings:
+            ring.unlink()
+        for slot in infer_slots:
+            slot.unlink()
+        lpr_ring.unlink()
+        stage_stats.unlink()
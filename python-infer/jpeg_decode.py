@@ -0,0 +1,192 @@
+# JPEG 解码 + 图像缓冲池 (JPEG Decode)
+# 接收端用 recv(copy=False) 拿到 zmq.Frame，直接从消息缓冲区 (memoryview) 解码，
+# 解码结果写进缓冲池里复用的数组，处理完归还，避免每帧 bytes 拷贝 + 新分配一张图。
+# simplejpeg 可用时解码到指定缓冲区；否则回退到 cv2.imdecode (仍免去 bytes 拷贝)。
+#
+# 降分辨率解码：推理尺寸小于原图时，利用 JPEG 的 DCT 缩放直接解码出 1/2、1/4、1/8 图，
+# 省掉全尺寸解码和随后的缩放；LPR 需要的全分辨率裁剪图按需再解码一次。
+import math
+import threading
+from collections import defaultdict
+import cv2
+import numpy as np
+
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
+
+REDUCED_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+# SOF 标记 (C4 / C8 / CC 不是帧头)
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(buf):
+    """只解析 JPEG 头部的 SOF 段，返回 (h, w)；解析失败返回 None"""
+    mv = memoryview(buf).cast("B")
+    i, n = 2, len(mv)
+    while i + 9 < n:
+        if mv[i] != 0xFF:
+            i += 1
+            continue
+        marker = mv[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in _SOF_MARKERS:
+            return (mv[i + 5] << 8) | mv[i + 6], (mv[i + 7] << 8) | mv[i + 8]
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        i += 2 + ((mv[i + 2] << 8) | mv[i + 3])
+    return None
+
+
+def reduce_factor(h, w, imgsz):
+    """在不低于推理尺寸的前提下可用的最大 DCT 缩放倍数 (1/2/4/8)"""
+    if not imgsz: return 1
+    f = 1
+    while f < 8 and max(h, w) / (f * 2) >= imgsz: f *= 2
+    return f
+
+
+def decode_into(buf, factor, out):
+    """
+    按 1/factor 解码到扁平 uint8 缓冲区 out 的前部 (如共享内存槽)，返回其上的 (h, w, 3) 视图；
+    out 放不下或解码失败返回 None
+    """
+    try:
+        if simplejpeg is not None:
+            h, w, _, _ = simplejpeg.decode_jpeg_header(buf)
+            rh, rw = math.ceil(h / factor), math.ceil(w / factor)
+            if rh * rw * 3 > out.size: return None
+            img = out[:rh * rw * 3].reshape(rh, rw, 3)
+            simplejpeg.decode_jpeg(buf, colorspace="BGR", min_height=rh, min_width=rw, buffer=img, strict=False)
+            return img
+        # 回退路径：cv2 解码后再拷进 out
+        img = cv2.imdecode(np.frombuffer(buf, np.uint8), REDUCED_FLAGS[factor])
+        if img is None or img.size > out.size: return None
+        view = out[:img.size].reshape(img.shape)
+        np.copyto(view, img)
+        return view
+    except Exception:
+        return None
+
+
+class BufferPool:
+    """按形状分组的 uint8 数组池，线程安全"""
+    def __init__(self, max_per_shape=32):
+        self.max_per_shape = max_per_shape
+        self.free = defaultdict(list)
+        self.lock = threading.Lock()
+        self.allocated = 0
+
+    def acquire(self, shape):
+        shape = tuple(shape)
+        with self.lock:
+            bufs = self.free.get(shape)
+            if bufs: return bufs.pop()
+            self.allocated += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, arr):
+        # 只回收池子分配出的完整数组 (视图 / 外部数组直接丢弃)
+        if arr is None or arr.base is not None: return
+        with self.lock:
+            bufs = self.free[arr.shape]
+            if len(bufs) < self.max_per_shape: bufs.append(arr)
+
+
+class JpegDecoder:
+    """decode(buf)：buf 可以是 bytes / memoryview / zmq.Frame.buffer，返回 BGR 图像"""
+    def __init__(self, pool=None):
+        self.pool = pool if pool is not None else BufferPool()
+        self.pooled = simplejpeg is not None
+
+    def decode(self, buf):
+        try:
+            if self.pooled:
+                h, w, _, _ = simplejpeg.decode_jpeg_header(buf)
+                out = self.pool.acquire((h, w, 3))
+                try:
+                    # 返回值是 out 上的视图，这里直接返回 out 本身以便归还
+                    simplejpeg.decode_jpeg(buf, colorspace="BGR", buffer=out, strict=False)
+                    return out
+                except ValueError:
+                    self.pool.release(out)
+                    return None
+            return cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+        except Exception:
+            return None
+
+    def release(self, img):
+        """图像处理完毕后归还缓冲区 (回退解码路径下为空操作)"""
+        if self.pooled: self.pool.release(img)
+
+    def decode_reduced(self, buf, factor):
+        """按 1/factor 尺寸解码 (factor 取 1/2/4/8)"""
+        if factor == 1: return self.decode(buf)
+        try:
+            if self.pooled:
+                h, w, _, _ = simplejpeg.decode_jpeg_header(buf)
+                rh, rw = math.ceil(h / factor), math.ceil(w / factor)
+                out = self.pool.acquire((rh, rw, 3))
+                try:
+                    # simplejpeg 选择不小于 min_height/min_width 的最小 DCT 缩放尺寸
+                    simplejpeg.decode_jpeg(buf, colorspace="BGR", min_height=rh, min_width=rw,
+                                           buffer=out, strict=False)
+                    return out
+                except ValueError:
+                    self.pool.release(out)
+                    return None
+            return cv2.imdecode(np.frombuffer(buf, np.uint8), REDUCED_FLAGS[factor])
+        except Exception:
+            return None
+
+    def decode_for(self, buf, imgsz):
+        """按推理尺寸挑选缩放倍数解码，返回 DecodedFrame (失败返回 None)"""
+        size = jpeg_size(buf)
+        if size is None: return None
+        factor = reduce_factor(size[0], size[1], imgsz)
+        img = self.decode_reduced(buf, factor)
+        if img is None: return None
+        return DecodedFrame(self, buf, img, size, factor)
+
+
+class DecodedFrame:
+    """
+    推理用的 (可能降分辨率的) 图像 + 原始 JPEG。
+    scale: 原图坐标 / 推理图坐标；crop() 按原图坐标取全分辨率裁剪图 (首次调用时才全尺寸解码)。
+    """
+    def __init__(self, decoder, buf, img, full_shape, factor):
+        self.decoder = decoder
+        self.buf = buf
+        self.img = img
+        self.full_shape = tuple(full_shape)   # (h, w)
+        self.factor = factor
+        # libjpeg 缩放尺寸向上取整，按实际尺寸计算比例
+        self.scale_x = full_shape[1] / img.shape[1]
+        self.scale_y = full_shape[0] / img.shape[0]
+        self._full = None
+
+    def to_full(self, xyxy):
+        """推理图坐标 -> 原图坐标 (N, 4)"""
+        if self.factor == 1: return xyxy
+        return xyxy * np.array([self.scale_x, self.scale_y, self.scale_x, self.scale_y], dtype=xyxy.dtype)
+
+    def full(self):
+        if self._full is None:
+            self._full = self.img if self.factor == 1 else self.decoder.decode(self.buf)
+        return self._full
+
+    def crop(self, x1, y1, x2, y2):
+        full = self.full()
+        if full is None: return None
+        return full[max(0, y1):y2, max(0, x1):x2]
+
+    def release(self):
+        self.decoder.release(self.img)
+        if self._full is not None and self._full is not self.img: self.decoder.release(self._full)
+        self.img = self._full = self.buf = None
@@ -0,0 +1,137 @@
+# 共享车牌识别服务 (LPR Service)
+# 所有 Worker 把车辆裁剪图写进共享内存请求环，由一个独立进程跑 HyperLPR。
+# 过线瞬间只做一次内存拷贝就返回，识别结果稍后通过结果队列合并回 metrics。
+# 同一 (摄像头, track ID) 只识别一次，重复请求直接回发缓存的结果。
+import time
+import queue
+from collections import OrderedDict
+import numpy as np
+from multiprocessing import shared_memory
+
+from stage_metrics import StageHistograms
+
+LPR_FREE, LPR_PENDING = 0, 1
+# 每个请求槽的元数据: state, track_id, h, w
+META_FIELDS = 4
+# 去重表上限，避免长时间运行后无限增长
+DEDUP_CAPACITY = 4096
+
+
+class LprRequestRing:
+    """共享内存请求环：每路摄像头独占若干槽，写入无需跨进程加锁"""
+    def __init__(self, name, n_cams, slots_per_cam=2, max_shape=(360, 640, 3), create=False):
+        self.name = name
+        self.n_cams = n_cams
+        self.slots_per_cam = slots_per_cam
+        self.max_shape = tuple(max_shape)
+        n_slots = n_cams * slots_per_cam
+        meta_bytes = n_slots * META_FIELDS * 8
+        size = meta_bytes + n_slots * int(np.prod(self.max_shape))
+
+        if create:
+            try: shared_memory.SharedMemory(name=name).unlink()
+            except: pass
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        buf = self.shm.buf
+        self.meta = np.ndarray((n_slots, META_FIELDS), dtype=np.int64, buffer=buf, offset=0)
+        self.crops = np.ndarray((n_slots,) + self.max_shape, dtype=np.uint8, buffer=buf, offset=meta_bytes)
+        if create: self.meta[:] = 0
+
+    def cam_slots(self, cam):
+        start = cam * self.slots_per_cam
+        return range(start, start + self.slots_per_cam)
+
+    def close(self):
+        self.meta = self.crops = None
+        self.shm.close()
+
+    def unlink(self):
+        try: self.shm.unlink()
+        except: pass
+
+
+class LprClient:
+    """Worker 侧：非阻塞提交裁剪图 (按 track 去重)，并取回已完成的识别结果"""
+    def __init__(self, ring_name, cam, n_cams, slots_per_cam, max_shape, request_event, result_queue):
+        self.ring = LprRequestRing(ring_name, n_cams, slots_per_cam, max_shape)
+        self.cam = cam
+        self.request_event = request_event
+        self.result_queue = result_queue
+        self.requested = OrderedDict()
+
+    def submit(self, track_id, crop):
+        """
+        该 track 的识别结果已经或即将可用时返回 True (已提交过的 track 不会重复提交)；
+        请求槽已满时丢弃并返回 False。从不阻塞。
+        """
+        if track_id in self.requested: return True
+        ring = self.ring
+        for slot in ring.cam_slots(self.cam):
+            if ring.meta[slot, 0] != LPR_FREE: continue
+            h = min(crop.shape[0], ring.max_shape[0])
+            w = min(crop.shape[1], ring.max_shape[1])
+            ring.crops[slot, :h, :w] = crop[:h, :w]
+            ring.meta[slot, 1:] = (track_id, h, w)
+            ring.meta[slot, 0] = LPR_PENDING
+            self.request_event.set()
+
+            self.requested[track_id] = True
+            if len(self.requested) > DEDUP_CAPACITY: self.requested.popitem(last=False)
+            return True
+        return False
+
+    def poll(self):
+        """取回所有已完成的结果 [(track_id, text, conf), ...]"""
+        results = []
+        while True:
+            try: results.append(self.result_queue.get_nowait())
+            except queue.Empty: return results
+
+
+def lpr_service_process(ring_name, n_cams, slots_per_cam, max_shape, request_event, result_queues,
+                        ready_event=None, stats_name=None):
+    import hyperlpr3
+
+    ring = LprRequestRing(ring_name, n_cams, slots_per_cam, max_shape)
+    # 识别耗时按摄像头记入分阶段直方图的 "lpr" 阶段
+    stats = StageHistograms(stats_name, n_cams) if stats_name else None
+    print("LPR Service: Loading HyperLPR...", end="", flush=True)
+    lpr = hyperlpr3.LicensePlateCatcher()
+    # 预热一次，首个车牌请求不再承担初始化开销
+    try: lpr(np.zeros((64, 160, 3), dtype=np.uint8))
+    except: pass
+    print("Done.")
+    if ready_event is not None: ready_event.set()
+
+    done = OrderedDict()  # (cam, track_id) -> (text, conf)，去重并缓存结果
+    while True:
+        if not request_event.wait(timeout=1.0): continue
+        request_event.clear()
+
+        for slot in np.flatnonzero(ring.meta[:, 0] == LPR_PENDING).tolist():
+            cam = slot // slots_per_cam
+            track_id, h, w = ring.meta[slot, 1:].tolist()
+            key = (cam, track_id)
+            # 先拷出裁剪图再释放槽，Worker 可以立即提交下一个请求
+            cached = done.get(key)
+            crop = None if cached is not None else ring.crops[slot, :h, :w].copy()
+            ring.meta[slot, 0] = LPR_FREE
+
+            if cached is not None:
+                # 重复请求也要回一条结果，否则 Worker 端该 track 一直显示 "..."
+                text, conf = cached
+            else:
+                text, conf = "", 0.0
+                t0 = time.perf_counter()
+                try:
+                    res = lpr(crop)
+                    if res: text, conf = res[0][0], float(res[0][1])
+                except: pass
+                if stats is not None: stats.record(cam, "lpr", time.perf_counter() - t0)
+                done[key] = (text, conf)
+                if len(done) > DEDUP_CAPACITY: done.popitem(last=False)
+            try: result_queues[cam].put_nowait((track_id, text, conf))
+            except: pass
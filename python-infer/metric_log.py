@@ -0,0 +1,210 @@
+# 列式性能日志 (Metric Log)
+# 写入线程把队列里积攒的记录一次性取出，转成定长结构化 NumPy 数组整块追加到文件，
+# 不再每帧格式化一行 CSV；文件按大小 / 时间 / 日期轮转。
+# 读取端直接 np.memmap 映射一天的日志做分析，需要时再导出 CSV。
+#
+# 文件格式 (*.rsulog)：256 字节头 (魔数 + dtype 描述 JSON) + 连续的定长记录
+import os
+import csv
+import glob
+import json
+import time
+import queue
+import threading
+from datetime import datetime
+import numpy as np
+import psutil
+
+MAGIC = b"RSULOG1\n"
+HEADER_SIZE = 256
+FILE_EXT = ".rsulog"
+
+RECORD_DTYPE = np.dtype([
+    ("unix_time", "<f8"),
+    ("cam_id", "S16"),
+    ("pi_cpu", "<f4"),
+    ("pc_cpu", "<f4"),
+    ("latency_ms", "<f4"),
+    ("obj_count", "<i4"),
+    ("avg_speed", "<i4"),
+    ("flow", "<i8"),
+    ("plate", "S32"),         # UTF-8 编码 (中文车牌约 9 字节)
+    ("queue_backlog", "<i4"),
+    ("dropped", "<i8"),       # 该路累计丢弃帧数 (准入控制)
+])
+
+CSV_HEADER = ["Timestamp", "Unix_Time", "Cam_ID", "Pi_CPU", "PC_CPU", "Latency_ms",
+              "Object_Count", "Avg_Speed", "Traffic_Flow", "Plate_Detected", "Queue_Backlog", "Dropped_Frames"]
+
+
+def _encode(text, size):
+    """按字节截断且不切断 UTF-8 多字节字符"""
+    return str(text).encode("utf-8")[:size].decode("utf-8", "ignore").encode("utf-8")
+
+
+class MetricLogger:
+    """
+    非阻塞性能日志：log() 只把一个元组放进队列，写入线程批量落盘。
+    fmt="columnar" 写二进制列式文件 (默认)；fmt="csv" 保留原来的 CSV 格式 (同样批量写入)。
+    """
+    def __init__(self, directory="rsu_logs", prefix="rsu_performance", fmt="columnar",
+                 rotate_mb=64, rotate_seconds=3600, batch_max=512, flush_interval=1.0):
+        self.q = queue.Queue()
+        self.directory = directory
+        self.prefix = prefix
+        self.fmt = fmt
+        self.rotate_bytes = int(rotate_mb * 1024 * 1024)
+        self.rotate_seconds = rotate_seconds
+        self.batch_max = batch_max
+        self.flush_interval = flush_interval
+        self.running = True
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self.f = None
+        self.seq = 0          # 同一秒内多次轮转时区分文件名
+        self.thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.thread.start()
+        print(f"📊 [Logger] Active ({fmt}). Saving to {directory}/")
+
+    def log(self, cam_id, pi_cpu, latency, obj_count, speed, flow, plate, q_size, dropped=0):
+        """将数据推入队列，非阻塞"""
+        self.q.put((time.time(), cam_id, pi_cpu, psutil.cpu_percent(), latency,
+                    obj_count, speed, flow, plate, q_size, dropped))
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=2.0)
+
+    # --- 写入线程 ---
+    def _drain(self):
+        try: batch = [self.q.get(timeout=self.flush_interval)]
+        except queue.Empty: return []
+        while len(batch) < self.batch_max:
+            try: batch.append(self.q.get_nowait())
+            except queue.Empty: break
+        return batch
+
+    def _open(self, now):
+        if self.f is not None: self.f.close()
+        stamp = datetime.fromtimestamp(now).strftime("%Y%m%d_%H%M%S")
+        ext = FILE_EXT if self.fmt == "columnar" else ".csv"
+        path = os.path.join(self.directory, f"{self.prefix}_{stamp}_{self.seq:04d}{ext}")
+        self.seq += 1
+        if self.fmt == "columnar":
+            self.f = open(path, "wb")
+            desc = json.dumps(RECORD_DTYPE.descr).encode()
+            self.f.write((MAGIC + desc).ljust(HEADER_SIZE, b" "))
+        else:
+            self.f = open(path, "w", newline="")
+            self.csv = csv.writer(self.f)
+            self.csv.writerow(CSV_HEADER)
+        self.opened_at = now
+        self.day = datetime.fromtimestamp(now).date()
+        self.path = path
+
+    def _need_rotate(self, now):
+        if self.f is None: return True
+        return (self.f.tell() >= self.rotate_bytes or now - self.opened_at >= self.rotate_seconds
+                or datetime.fromtimestamp(now).date() != self.day)
+
+    def _write(self, batch):
+        if self.fmt == "columnar":
+            rows = [(t, _encode(cam, 16), pi, pc, lat, cnt, spd, flow, _encode(plate, 32), q, drop)
+                    for t, cam, pi, pc, lat, cnt, spd, flow, plate, q, drop in batch]
+            self.f.write(np.array(rows, dtype=RECORD_DTYPE).tobytes())
+        else:
+            self.csv.writerows(to_csv_rows(batch))
+
+    def _writer_loop(self):
+        while self.running or not self.q.empty():
+            batch = self._drain()
+            if not batch: continue
+            try:
+                now = batch[0][0]
+                if self._need_rotate(now): self._open(now)
+                self._write(batch)
+                self.f.flush()
+                self.written += len(batch)
+            except Exception as e:
+                print(f"Logger Error: {e}")
+        if self.f is not None: self.f.close()
+
+
+# ================= 读取 / 导出 =================
+def to_csv_rows(records):
+    """记录 (元组或结构化数组行) -> 原 CSV 格式的行"""
+    rows = []
+    for rec in records:
+        # 旧文件没有 dropped 列
+        t, cam, pi, pc, lat, cnt, spd, flow, plate, q, *rest = rec
+        drop = rest[0] if rest else 0
+        if isinstance(cam, bytes): cam = cam.decode("utf-8", "ignore")
+        if isinstance(plate, bytes): plate = plate.decode("utf-8", "ignore")
+        ts = datetime.fromtimestamp(float(t))
+        rows.append([ts.strftime("%H:%M:%S.%f")[:-3], f"{float(t):.3f}", cam, f"{pi:.1f}", f"{pc:.1f}",
+                     f"{lat:.1f}", int(cnt), int(spd), int(flow), plate, int(q), int(drop)])
+    return rows
+
+
+def open_log(path):
+    """把一个 .rsulog 文件映射为只读结构化数组 (末尾未写完整的记录会被忽略)"""
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+    if not header.startswith(MAGIC): raise ValueError(f"Not a metric log: {path}")
+    dtype = np.dtype([tuple(field) for field in json.loads(header[len(MAGIC):].strip().decode())])
+    n = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    if n <= 0: return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(n,))
+
+
+def day_files(directory="rsu_logs", day=None, prefix="rsu_performance"):
+    """某一天 (YYYYMMDD，默认今天) 的日志文件，按时间排序"""
+    day = day or datetime.now().strftime("%Y%m%d")
+    return sorted(glob.glob(os.path.join(directory, f"{prefix}_{day}_*{FILE_EXT}")))
+
+
+def _align(records, dtype):
+    """按 dtype 重排字段；旧文件缺少的字段 (如后加的 dropped) 填 0"""
+    if records.dtype == dtype: return records
+    out = np.zeros(len(records), dtype=dtype)
+    for name in dtype.names:
+        if name in records.dtype.names: out[name] = records[name]
+    return out
+
+
+def load_day(directory="rsu_logs", day=None, prefix="rsu_performance", concat=True):
+    """映射一天的日志；concat=False 返回各文件的 memmap 列表 (零拷贝)。
+    同一天混有新旧格式的文件时，拼接前统一对齐到最新文件的 dtype"""
+    parts = [open_log(p) for p in day_files(directory, day, prefix)]
+    if not concat: return parts
+    if not parts: return np.zeros(0, dtype=RECORD_DTYPE)
+    if len(parts) == 1: return parts[0]
+    dtype = parts[-1].dtype
+    return np.concatenate([_align(part, dtype) for part in parts])
+
+
+def export_csv(records, out_path):
+    with open(out_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        writer.writerows(to_csv_rows(records))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Metric log summary / CSV export")
+    parser.add_argument("directory", nargs="?", default="rsu_logs")
+    parser.add_argument("--day", default=None, help="YYYYMMDD, default today")
+    parser.add_argument("--csv", default=None, help="export to this CSV path")
+    args = parser.parse_args()
+
+    rec = load_day(args.directory, args.day)
+    print(f"{len(rec)} records")
+    for cam in np.unique(rec["cam_id"]):
+        lat = rec["latency_ms"][rec["cam_id"] == cam]
+        print(f"{cam.decode():10s} n={len(lat):7d} p50={np.percentile(lat, 50):6.1f}ms "
+              f"p95={np.percentile(lat, 95):6.1f}ms p99={np.percentile(lat, 99):6.1f}ms")
+    if args.csv:
+        export_csv(rec, args.csv)
+        print(f"CSV -> {args.csv}")
@@ -0,0 +1,57 @@
+# 跨摄像头微批调度 (Micro-Batching)
+# 接收线程只负责入队；调度线程从第一帧到达起最多等待 window 秒或凑满 max_batch 帧，
+# 把这一批交给 handler 做一次批量前向，而不是每帧一次 batch=1 的推理。
+# 批内顺序即到达顺序，同一路摄像头的帧不会乱序。
+import time
+import queue
+import threading
+
+
+class MicroBatcher:
+    """按时间窗 / 批大小聚合请求，单线程调用 handler(batch)"""
+    def __init__(self, handler, max_batch=8, window=0.005, maxsize=256, q=None):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.window = window
+        # 可传入自定义队列 (如 admission.AdmissionQueue)，需兼容 queue.Queue 的 put_nowait / get
+        self.q = q if q is not None else queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        """非阻塞入队；积压超过上限时丢弃并计数"""
+        try:
+            self.q.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def qsize(self):
+        return self.q.qsize()
+
+    def stop(self):
+        self.running = False
+
+    def _collect(self):
+        try: first = self.q.get(timeout=0.5)
+        except queue.Empty: return []
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                # 窗口已过也先把队列里现成的帧带上，不额外等待
+                batch.append(self.q.get(timeout=remaining) if remaining > 0 else self.q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while self.running:
+            batch = self._collect()
+            if not batch: continue
+            try: self.handler(batch)
+            except Exception as e: print(f"Batch Error: {e}")
@@ -0,0 +1,128 @@
+# MJPEG 广播中心 (Encode Once, Fan Out)
+# 每路摄像头只有一个编码线程：新帧到达时编码一次，
+# 同一份 JPEG 字节分发给所有浏览器连接；慢的订阅者直接跳到最新帧。
+# JPEG 的 CPU 开销与观看人数无关。
+import time
+import threading
+import cv2
+
+MJPEG_MIMETYPE = 'multipart/x-mixed-replace; boundary=frame'
+
+
+def mjpeg_part(jpg_bytes):
+    return b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + jpg_bytes + b'\r\n'
+
+
+class LatestFrame:
+    """线程间的最新帧槽：生产者覆盖写入，读者按序号等待新帧 (接口与 FrameRing 一致)"""
+    def __init__(self, frame=None):
+        self.cond = threading.Condition()
+        # 有初始画面 (如黑屏占位) 时视为第 1 帧，新连接可以立即看到
+        self.seq = 0 if frame is None else 1
+        self.ts = 0.0
+        self.frame = frame
+
+    def publish(self, frame, capture_ts=None):
+        with self.cond:
+            self.frame = frame
+            self.ts = time.time() if capture_ts is None else capture_ts
+            self.seq += 1
+            self.cond.notify_all()
+            return self.seq
+
+    def read_latest(self):
+        with self.cond:
+            if self.frame is None: return None
+            return self.seq, self.ts, self.frame
+
+    def wait_newer(self, last_seq, timeout=1.0, out=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > last_seq, timeout=timeout):
+                return None
+            return self.seq, self.ts, self.frame
+
+
+class MjpegBroadcaster:
+    """单路摄像头的编码线程 + 订阅者分发"""
+    def __init__(self, source, quality=70, idle_timeout=5.0):
+        # source 需提供 wait_newer(last_seq, timeout=...) -> (seq, ts, frame) | None
+        self.source = source
+        self.quality = quality
+        self.idle_timeout = idle_timeout
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.chunk = None
+        self.subscribers = 0
+        self.thread = None
+
+    def _encoder_loop(self):
+        last_src = 0
+        frame_buf = None
+        idle_since = None
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        while True:
+            with self.cond:
+                if self.subscribers == 0:
+                    idle_since = idle_since or time.time()
+                    # 无人观看一段时间后退出，不再消耗编码 CPU
+                    if time.time() - idle_since > self.idle_timeout:
+                        self.thread = None
+                        return
+                else:
+                    idle_since = None
+
+            got = self.source.wait_newer(last_src, timeout=0.5, out=frame_buf)
+            if got is None: continue
+            last_src, _, frame = got
+            # 编码完成前不会再读下一帧，拷贝缓冲可以复用
+            frame_buf = frame
+            ret, buffer = cv2.imencode('.jpg', frame, params)
+            if not ret: continue
+
+            with self.cond:
+                self.chunk = mjpeg_part(buffer.tobytes())
+                self.seq += 1
+                self.cond.notify_all()
+
+    def subscribe(self):
+        """Flask Response 使用的生成器；连接断开时自动退订"""
+        with self.cond:
+            self.subscribers += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._encoder_loop, daemon=True)
+                self.thread.start()
+        try:
+            last = 0
+            while True:
+                with self.cond:
+                    if not self.cond.wait_for(lambda: self.seq > last, timeout=1.0):
+                        continue
+                    # 只取最新的一帧，积压的中间帧直接跳过
+                    last, chunk = self.seq, self.chunk
+                yield chunk
+        finally:
+            with self.cond:
+                self.subscribers -= 1
+
+
+class MjpegHub:
+    """按摄像头编号懒加载广播器"""
+    def __init__(self, source_factory, quality=70, idle_timeout=5.0):
+        self.source_factory = source_factory
+        self.quality = quality
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.broadcasters = {}
+
+    def get(self, cam_id):
+        with self.lock:
+            if cam_id not in self.broadcasters:
+                source = self.source_factory(cam_id)
+                if source is None: return None
+                self.broadcasters[cam_id] = MjpegBroadcaster(source, self.quality, self.idle_timeout)
+            return self.broadcasters[cam_id]
+
+    def stream(self, cam_id):
+        broadcaster = self.get(cam_id)
+        if broadcaster is None: return iter(())
+        return broadcaster.subscribe()
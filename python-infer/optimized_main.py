@@ -6,11 +6,14 @@ import json
 import numpy as np
 import psutil
 import multiprocessing as mp
-from multiprocessing import shared_memory
 from flask import Flask, Response, render_template
-from ultralytics import YOLO
 import hyperlpr3
 from PIL import Image, ImageDraw, ImageFont  # 引入 PIL 处理中文
+from frame_bus import FrameRing
+from detector import create_detector
+from tracking import create_tracker, update_tracker
+from render_cache import TintBand, PatchCache
+from mjpeg_hub import MjpegHub, MJPEG_MIMETYPE
 
 # ================= 1. 系统配置 =================
 VIDEOS = [
@@ -22,25 +25,31 @@ VIDEOS = [
 
 PRIORITY_MAP = {0: "HIGH", 1: "HIGH", 2: "LOW", 3: "LOW"}
 FRAME_W, FRAME_H = 640, 360
-SHM_SIZE = FRAME_W * FRAME_H * 3
+FRAME_RING_SLOTS = 3
 NEON_COLORS = [(0, 255, 255), (255, 0, 255), (0, 255, 0), (0, 165, 255)]
 
 # ================= 2. 中文绘制工具 (PIL) =================
+# 树莓派标准中文字体路径
+FONT_PATH = "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc"
+_FONTS = {}
+
+def load_font(text_size):
+    """字体只加载一次 (原来每帧都重新读取 ttc 文件)"""
+    if text_size not in _FONTS:
+        try:
+            _FONTS[text_size] = ImageFont.truetype(FONT_PATH, text_size)
+        except:
+            # 如果找不到字体，使用默认（仍然不支持中文，但不会报错）
+            _FONTS[text_size] = ImageFont.load_default()
+            print("Warning: Chinese font not found. Please install fonts-wqy-zenhei")
+    return _FONTS[text_size]
+
 def cv2_add_chinese_text(img, text, position, text_color=(255, 255, 255), text_size=20):
     if (isinstance(img, np.ndarray)): 
         img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
     
     draw = ImageDraw.Draw(img)
-    # 树莓派标准中文字体路径
-    font_path = "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc"
-    try:
-        font = ImageFont.truetype(font_path, text_size)
-    except:
-        # 如果找不到字体，使用默认（仍然不支持中文，但不会报错）
-        font = ImageFont.load_default()
-        print("Warning: Chinese font not found. Please install fonts-wqy-zenhei")
-    
-    draw.text(position, text, font=font, fill=text_color)
+    draw.text(position, text, font=load_font(text_size), fill=text_color)
     return cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
 
 # ================= 3. 核心算法：自适应调度器 =================
@@ -65,32 +74,46 @@ class AdaptiveScheduler:
         return skip, scale
 
 # ================= 4. 融合 UI 绘制 =================
-def draw_osd_fusion(frame, cam_id, priority, fps, count, plate, cpu_load, status_msg):
-    # 背景
-    overlay = frame.copy()
-    cv2.rectangle(overlay, (0, 0), (640, 40), (0, 0, 0), -1) 
-    cv2.rectangle(overlay, (0, 320), (220, 360), (0, 0, 0), -1) 
-    cv2.addWeighted(overlay, 0.7, frame, 0.3, 0, frame)
-
-    # 英文信息用 OpenCV 画（快）
-    color_p = (0, 255, 0) if priority == "HIGH" else (0, 255, 255)
-    cv2.putText(frame, f"CAM-{cam_id+1} [{priority}]", (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color_p, 2)
-    
-    color_cpu = (0, 0, 255) if cpu_load > 90 else (255, 255, 255)
-    cv2.putText(frame, f"CPU:{cpu_load}%", (200, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color_cpu, 1)
-    cv2.putText(frame, status_msg, (350, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
+class OsdRenderer:
+    """
+    融合 OSD：两条半透明底栏只在各自 ROI 内混合 (原地写回，不再整帧 copy)，
+    中文车牌块按车牌缓存，只有车牌变化时才走一次 PIL。
+    """
+    def __init__(self, cam_id, priority):
+        self.title = f"CAM-{cam_id+1} [{priority}]"
+        self.title_color = (0, 255, 0) if priority == "HIGH" else (0, 255, 255)
+        # 背景
+        self.bars = [TintBand((0, 0, 640, 41), (0, 0, 0), 0.7),
+                     TintBand((0, 320, 221, 360), (0, 0, 0), 0.7)]
+        self.plate_rect = (450, 310, 640, 360)
+        self.plates = PatchCache(maxsize=16)
 
-    cv2.putText(frame, f"FPS: {fps}", (10, 345), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
-    cv2.putText(frame, f"Count: {count}", (100, 345), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 1)
-    
-    # === 关键修改：中文车牌用 PIL 画 ===
-    if plate != "--":
-        # 绘制车牌背景
-        cv2.rectangle(frame, (450, 310), (640, 360), (255, 255, 255), -1)
-        # 用 PIL 绘制中文车牌 (蓝色字体)
-        frame = cv2_add_chinese_text(frame, plate, (460, 315), (200, 0, 0), 30)
+    def _render_plate(self, plate):
+        # 绘制车牌背景 + 用 PIL 绘制中文车牌 (只在车牌变化时执行)
+        x1, y1, x2, y2 = self.plate_rect
+        patch = np.full((y2 - y1, x2 - x1, 3), 255, dtype=np.uint8)
+        return cv2_add_chinese_text(patch, plate, (460 - x1, 315 - y1), (200, 0, 0), 30)
 
-    return frame
+    def render(self, frame, fps, count, plate, cpu_load, status_msg):
+        for bar in self.bars: bar.apply(frame)
+
+        # 英文信息用 OpenCV 画（快）
+        cv2.putText(frame, self.title, (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, self.title_color, 2)
+        
+        color_cpu = (0, 0, 255) if cpu_load > 90 else (255, 255, 255)
+        cv2.putText(frame, f"CPU:{cpu_load}%", (200, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color_cpu, 1)
+        cv2.putText(frame, status_msg, (350, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
+
+        cv2.putText(frame, f"FPS: {fps}", (10, 345), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
+        cv2.putText(frame, f"Count: {count}", (100, 345), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 1)
+        
+        # === 中文车牌：缓存好的像素块直接贴上 ===
+        if plate != "--":
+            x1, y1, x2, y2 = self.plate_rect
+            patch = self.plates.get(plate, lambda: self._render_plate(plate))
+            frame[y1:y2, x1:x2] = patch[:frame.shape[0] - y1, :frame.shape[1] - x1]
+
+        return frame
 
 class SmartCounter:
     def __init__(self):
@@ -128,17 +151,18 @@ class SmartCounter:
 # ================= 5. Worker 进程 =================
 def worker_process(index, video_path, shm_name, global_config):
     try:
-        existing_shm = shared_memory.SharedMemory(name=shm_name)
-        shared_frame = np.ndarray((FRAME_H, FRAME_W, 3), dtype=np.uint8, buffer=existing_shm.buf)
+        ring = FrameRing(shm_name, (FRAME_H, FRAME_W, 3), slots=FRAME_RING_SLOTS)
     except: return
 
-    model = YOLO("yolov8n.pt")
+    detector = create_detector(weights="yolov8n.pt", imgsz=640, conf=0.4, classes=[2,3,5,7])
+    tracker = create_tracker()
     lpr = hyperlpr3.LicensePlateCatcher()
     counter = SmartCounter()
     scheduler = AdaptiveScheduler()
     cap = cv2.VideoCapture(video_path)
     
     my_priority = PRIORITY_MAP.get(index, "LOW")
+    osd = OsdRenderer(index, my_priority)
     cached_boxes = [] 
     cached_ids = []
     
@@ -153,6 +177,7 @@ def worker_process(index, video_path, shm_name, global_config):
         if not ret:
             cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
             continue
+        capture_ts = time.time()
 
         frame = cv2.resize(frame, (FRAME_W, FRAME_H))
         frame_cnt += 1
@@ -166,14 +191,13 @@ def worker_process(index, video_path, shm_name, global_config):
         # AI 推理
         if frame_cnt % current_skip == 0:
             infer_w = int(640 * current_scale)
-            results = model.track(frame, imgsz=infer_w, persist=True, verbose=False, 
-                                classes=[2,3,5,7], conf=0.4, tracker="bytetrack.yaml")
+            tracks = update_tracker(tracker, detector.detect([frame], imgsz=infer_w)[0], frame)
             
-            if results[0].boxes.id is not None:
+            if len(tracks) > 0:
                 scale_factor = 1.0 / current_scale
-                boxes = results[0].boxes.xyxy.cpu().numpy() * scale_factor
+                boxes = tracks[:, :4] * scale_factor
                 cached_boxes = boxes.astype(int)
-                cached_ids = results[0].boxes.id.cpu().numpy().astype(int)
+                cached_ids = tracks[:, 4].astype(int)
                 counter.update(cached_boxes, cached_ids, frame, lpr)
             else:
                 cached_boxes = []
@@ -193,12 +217,11 @@ def worker_process(index, video_path, shm_name, global_config):
 
         status = global_config.get(index, {"cpu":0, "mode":"Init"})
         
-        # 调用支持中文的绘制函数
-        frame = draw_osd_fusion(frame, index, my_priority, real_fps, 
-                              counter.count, counter.last_plate, 
-                              status["cpu"], status["mode"])
+        # 调用支持中文的绘制函数 (原地绘制)
+        osd.render(frame, real_fps, counter.count, counter.last_plate,
+                   status["cpu"], status["mode"])
 
-        np.copyto(shared_frame, frame)
+        ring.write(frame, capture_ts)
         sleep_time = 0.01 if my_priority == "HIGH" else 0.02
         time.sleep(sleep_time)
 
@@ -209,33 +232,24 @@ app = Flask(__name__)
 def index():
     return render_template('index.html')
 
-def generate_feed(index):
-    shm_name = f"psm_cam_{index}"
-    try:
-        existing_shm = shared_memory.SharedMemory(name=shm_name)
-        shm_view = np.ndarray((FRAME_H, FRAME_W, 3), dtype=np.uint8, buffer=existing_shm.buf)
-    except: return
+def open_frame_ring(index):
+    try: return FrameRing(f"psm_cam_{index}", (FRAME_H, FRAME_W, 3), slots=FRAME_RING_SLOTS)
+    except: return None
 
-    while True:
-        ret, buffer = cv2.imencode('.jpg', shm_view, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-        time.sleep(0.05)
+# 每路只编码一次，所有浏览器连接共享同一份 JPEG
+FEED_HUB = MjpegHub(open_frame_ring, quality=85)
 
 @app.route('/video_feed/<int:cam_id>')
 def video_feed(cam_id):
-    return Response(generate_feed(cam_id), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(FEED_HUB.stream(cam_id), mimetype=MJPEG_MIMETYPE)
 
 if __name__ == '__main__':
     mp.set_start_method('spawn', force=True)
     manager = mp.Manager()
     global_config = manager.dict()
 
-    shm_handlers = []
-    for i in range(4):
-        try: shared_memory.SharedMemory(name=f"psm_cam_{i}").unlink()
-        except: pass
-        shm = shared_memory.SharedMemory(name=f"psm_cam_{i}", create=True, size=SHM_SIZE)
-        shm_handlers.append(shm)
+    frame_rings = [FrameRing(f"psm_cam_{i}", (FRAME_H, FRAME_W, 3), slots=FRAME_RING_SLOTS, create=True)
+                   for i in range(4)]
 
     processes = []
     for i in range(4):
@@ -248,6 +262,5 @@ if __name__ == '__main__':
         print(">>> RoadOS Pro System Started.")
         app.run(host='0.0.0.0', port=5000, threaded=True, use_reloader=False)
     finally:
-        for shm in shm_handlers: 
-            try: shm.unlink()
-            except: pass
+        for ring in frame_rings:
+            ring.unlink()
@@ -1,109 +1,90 @@
 import zmq
 import json
 import time
-import cv2
-import numpy as np
 import warnings
 import psutil
 import threading
 import torch
-import csv
 import os
 import math
-from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
 from queue import Queue, Empty
 import hyperlpr3
-from ultralytics import YOLO
+from detector import create_detector, warmup
+from tracking import create_tracker, update_tracker
+from micro_batch import MicroBatcher
+from sharded_executor import ShardedExecutor
+from expiry import ExpiringDict
+from flow_counter import FlowCounter
+from metric_log import MetricLogger
+from admission import FairScheduler
+from jpeg_decode import JpegDecoder
+from process_tier import ProcessTier
+from result_codec import encode_batch, KIND_LPR
+from result_dispatch import ResultDispatcher
+from startup import use_warm_start, ReadyBarrier
 
 # === 1. 全局配置 ===
 PI_IP = '192.168.137.166'  # ⚠️ 请确保这是树莓派的 IP
 PULL_PORT = "5555"
 PUSH_PORT = "5556"
+# 回传格式："json" 逐条 send_json (旧格式)；"binary" 同时就绪的结果合并成一条 multipart (result_codec)。
+# PUSH 端口的消费者是 Go 的 rsu-go-core (docker-compose 里的 PULL 服务)，只认 JSON，
+# 等它能解 result_codec 之后再切到 "binary"
+RESULT_FORMAT = "json"
+RESULT_BATCH_MAX = 32
+
+# 准入控制：每路只保留最新一帧待处理；采集时间 + 延迟预算之后仍未开始处理的帧直接丢弃
+FRAME_BUDGET_MS = 300   # 未知优先级类的默认预算
+# 优先级调度：帧元数据可声明 "priority" ("HIGH"/"LOW") 与 "budget_ms"，未声明时按 CAMERA_PRIORITY / 类的预算。
+# 类间按权重公平分配检测吞吐，类内截止时间最早的先处理；过载时 LOW 先降级 (被新帧替换 / 超时丢弃)
+CAMERA_PRIORITY = {"CAM-01": "HIGH", "CAM-02": "HIGH", "CAM-03": "LOW", "CAM-04": "LOW"}
+PRIORITY_CLASSES = {"HIGH": {"weight": 3, "budget_ms": 300}, "LOW": {"weight": 1, "budget_ms": 1000}}
+SCHED_STATS_INTERVAL = 10   # 秒，按类的排队统计写到 LOG_DIR/scheduler_stats.json
+
+# 跨摄像头微批：最多等待 BATCH_WINDOW_MS 或凑满 BATCH_MAX_FRAMES 帧做一次批量检测
+# (MICRO_BATCH=False 时逐帧检测)
+MICRO_BATCH = True
+BATCH_MAX_FRAMES = 8
+BATCH_WINDOW_MS = 5
+# 检测输入尺寸：原图长边 >= 2/4/8 倍时直接按 1/2、1/4、1/8 解码 (如 1280x720 配 320)，
+# 检测框映射回原图坐标；LPR 裁剪按需解码全分辨率图
+INFER_IMGSZ = 640
+# 分片线程数上限 (每路摄像头固定归属一个分片)
+SHARD_THREADS = 8
+
+# 多进程执行层：解码 / 跟踪 / 分析放到 TIER_WORKERS 个进程，推理独占一个进程，图像经共享内存交换
+# (False 时沿用单进程 + 线程的方式)
+PROCESS_TIER = False
+TIER_WORKERS = 4
+TIER_SLOTS = 32
+READY_TIMEOUT = 120
+
+# 轨迹表：超过 TRACK_TTL 秒未出现即过期，最多保留 TRACK_CAP 个 (车牌缓存随轨迹一起淘汰)
+TRACK_TTL = 10.0
+TRACK_CAP = 512
 
 warnings.filterwarnings("ignore")
 
 # === 2. 高性能日志记录模块 (MetricLogger) ===
-class MetricLogger:
-    def __init__(self, filename="rsu_performance.csv"):
-        self.q = Queue()
-        self.filename = filename
-        self.running = True
-        
-        # 初始化 CSV 文件头 (增加了 Speed 和 Flow 字段)
-        if not os.path.exists(self.filename):
-            with open(self.filename, mode='w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    "Timestamp", "Unix_Time", "Cam_ID", 
-                    "Pi_CPU", "PC_CPU", "Latency_ms", 
-                    "Object_Count", "Avg_Speed", "Traffic_Flow",
-                    "Plate_Detected", "Queue_Backlog"
-                ])
-        
-        # 启动独立写入线程 (Daemon 守护线程)
-        self.thread = threading.Thread(target=self._writer_loop, daemon=True)
-        self.thread.start()
-        print(f"📊 [Logger] Active. Saving to {self.filename}")
-
-    def log(self, cam_id, pi_cpu, latency, obj_count, speed, flow, plate, q_size):
-        """将数据推入队列，非阻塞"""
-        data = {
-            "time": datetime.now(),
-            "cam": cam_id,
-            "pi": pi_cpu,
-            "pc": psutil.cpu_percent(),
-            "lat": latency,
-            "cnt": obj_count,
-            "spd": speed,
-            "flow": flow,
-            "plate": plate,
-            "q": q_size
-        }
-        self.q.put(data)
-
-    def _writer_loop(self):
-        """后台写入循环，批量写入减少IO开销"""
-        with open(self.filename, mode='a', newline='') as f:
-            writer = csv.writer(f)
-            while self.running:
-                try:
-                    item = self.q.get(timeout=2.0)
-                    writer.writerow([
-                        item["time"].strftime("%H:%M:%S.%f")[:-3],
-                        f"{item['time'].timestamp():.3f}",
-                        item["cam"],
-                        f"{item['pi']:.1f}",
-                        f"{item['pc']:.1f}",
-                        f"{item['lat']:.1f}",
-                        item["cnt"],
-                        item["spd"],
-                        item["flow"],
-                        item["plate"],
-                        item["q"]
-                    ])
-                    # 确保数据不丢失
-                    if self.q.empty(): f.flush()
-                    self.q.task_done()
-                except Empty:
-                    continue
-                except Exception as e:
-                    print(f"Logger Error: {e}")
+# 批量列式写入 + 轮转，见 metric_log.py (python metric_log.py rsu_logs --csv out.csv 导出)
+LOG_DIR = "rsu_logs"
+LOG_FORMAT = "columnar"   # "csv" 则沿用原 CSV 格式
 
 # === 3. 交通分析核心类 (TrafficAnalyst) ===
 class TrafficAnalyst:
+    """每路摄像头一个实例，只由该摄像头所在的分片线程访问，因此无需加锁"""
     def __init__(self):
-        self.tracks = {}
-        self.total_flow = set()
+        # track_id -> {'pos', 'time', 'speed', 'plate'}，按最后出现时间有序
+        self.tracks = ExpiringDict(ttl=TRACK_TTL, max_items=TRACK_CAP)
+        # 车流量：滚动窗口计数 + HyperLogLog 去重总量，内存恒定
+        self.flow = FlowCounter()
         self.px_to_m = 20.0 / 640.0 
-        self.lock = threading.Lock()
 
     def get_known_plate(self, track_id):
         """快速查询该ID是否已有车牌记录，避免重复OCR"""
-        with self.lock:
-            if track_id in self.tracks:
-                return self.tracks[track_id]['plate']
-        return "--"
+        data = self.tracks.get(track_id)
+        return data['plate'] if data is not None else "--"
 
     def update(self, track_id, box, new_plate_text):
         x1, y1, x2, y2 = box
@@ -114,49 +95,84 @@ class TrafficAnalyst:
         # 优先使用历史识别到的车牌
         final_plate = new_plate_text
         
-        with self.lock:
-            self.total_flow.add(track_id)
+        last_data = self.tracks.get(track_id)
+        if last_data is None:
+            # 新出现的车辆计入流量
+            self.flow.add(track_id, now)
+        else:
+            # 逻辑修正：如果历史记录里有车牌，且当前传入的是无效值，则保持历史值
+            if last_data['plate'] != "--":
+                final_plate = last_data['plate']
             
-            if track_id in self.tracks:
-                last_data = self.tracks[track_id]
-                
-                # 逻辑修正：如果历史记录里有车牌，且当前传入的是无效值，则保持历史值
-                if last_data['plate'] != "--":
-                    final_plate = last_data['plate']
-                
-                # 速度计算
-                dt = now - last_data['time']
-                if dt > 0.05:
-                    dx = cx - last_data['pos'][0]
-                    dy = cy - last_data['pos'][1]
-                    dist_px = math.sqrt(dx**2 + dy**2)
-                    dist_m = dist_px * self.px_to_m
-                    raw_speed = (dist_m / dt) * 3.6 
-                    speed = 0.6 * raw_speed + 0.4 * last_data['speed'] # 系数调整更平滑
-            
-            self.tracks[track_id] = {
-                'pos': (cx, cy),
-                'time': now,
-                'speed': speed,
-                'plate': final_plate
-            }
-            
-            # 清理过期ID
-            if len(self.tracks) > 200:
-                old_ids = [k for k, v in self.tracks.items() if now - v['time'] > 10.0]
-                for k in old_ids: del self.tracks[k]
+            # 速度计算
+            dt = now - last_data['time']
+            if dt > 0.05:
+                dx = cx - last_data['pos'][0]
+                dy = cy - last_data['pos'][1]
+                dist_px = math.sqrt(dx**2 + dy**2)
+                dist_m = dist_px * self.px_to_m
+                raw_speed = (dist_m / dt) * 3.6 
+                speed = 0.6 * raw_speed + 0.4 * last_data['speed'] # 系数调整更平滑
+        
+        self.tracks.put(track_id, {
+            'pos': (cx, cy),
+            'time': now,
+            'speed': speed,
+            'plate': final_plate
+        }, now)
+        
+        # 清理过期ID (只弹出队头已超时的项，摊还 O(1))
+        self.tracks.expire(now)
 
-        return int(speed), final_plate, len(self.total_flow)
+        return int(speed), final_plate, self.flow.total()
 
 # === 4. 全局资源与初始化 ===
-PERF_LOGGER = MetricLogger() # 启动日志记录器
+PERF_LOGGER = None   # 只在主进程创建 (多进程模式下 worker 导入本模块时不启动日志线程)
 ANALYSTS = {f"CAM-{i:02d}": TrafficAnalyst() for i in range(1, 5)} # 4路分析器
-YOLO_MODELS = {}
-YOLO_LOCK = threading.Lock()
 LPR_MODEL = None
 RESULT_QUEUE = Queue(maxsize=200)
+# 检测权重只加载一次，所有摄像头共用；跟踪器状态按摄像头独立 (轻量对象，按需创建)。
+# 每路摄像头的跟踪器只由其所属线程访问 (微批调度线程 或 该摄像头的分片)。
+DETECTOR = None
+TRACKERS = {}
 
-def init_global_resources():
+def frame_priority(item):
+    meta = item[0]
+    return meta.get("priority") or CAMERA_PRIORITY.get(meta.get("cam_id", "UNK"), "LOW")
+
+# Pi 与 PC 时钟不同步：按摄像头估计偏移 = min(接收时间 - 发送端时间戳) (时钟差 + 最小网络延迟)，
+# 发送端时间戳加上偏移换算到本机时钟，结果总不晚于接收时间。偏差突然变大 CLOCK_RESYNC_S 以上
+# (发送端时钟往回跳) 时重新对齐，避免之后的帧全部被误判超时。
+CLOCK_RESYNC_S = 2.0
+CLOCK_OFFSETS = {}   # cam -> 偏移 (秒)，只在 ADMISSION 的锁内读写
+
+def capture_time(meta, t_recv):
+    """发送端采集时间 (capture_ts/ts) 换算到本机时钟；元数据没有时间戳时用接收时间"""
+    ts = meta.get("capture_ts", meta.get("ts"))
+    if not isinstance(ts, (int, float)): return t_recv
+    cam_id = meta.get("cam_id", "UNK")
+    sample = t_recv - float(ts)
+    offset = CLOCK_OFFSETS.get(cam_id)
+    if offset is None or sample < offset or sample - offset > CLOCK_RESYNC_S:
+        offset = CLOCK_OFFSETS[cam_id] = sample
+    return float(ts) + offset
+
+def frame_deadline(item):
+    """截止时间 = 采集时间 (换算到本机时钟) + 预算 (元数据 budget_ms 或所属类的预算)"""
+    meta, _, t_recv = item
+    t_cap = capture_time(meta, t_recv)
+    budget = meta.get("budget_ms")
+    if not isinstance(budget, (int, float)):
+        budget = PRIORITY_CLASSES.get(frame_priority(item), {}).get("budget_ms", FRAME_BUDGET_MS)
+    return t_cap + budget / 1000.0
+
+# 解码直接读 zmq 消息缓冲区，输出图像来自复用的缓冲池 (分析完毕后归还)
+DECODER = JpegDecoder()
+ADMISSION = FairScheduler(key_fn=lambda item: item[0].get("cam_id", "UNK"), deadline_fn=frame_deadline,
+                          class_fn=frame_priority, weights={c: v["weight"] for c, v in PRIORITY_CLASSES.items()})
+
+def init_lpr_model():
+    """加载车牌模型 (多进程模式下在每个 worker 进程里调用)"""
     global LPR_MODEL
     try:
         LPR_MODEL = hyperlpr3.LicensePlateCatcher()
@@ -164,55 +180,72 @@ def init_global_resources():
     except Exception as e:
         print(f"❌ [Init] HyperLPR Failed: {e}")
 
-def get_yolo_model(cam_id):
-    with YOLO_LOCK:
-        if cam_id not in YOLO_MODELS:
-            print(f"🔄 [YOLO] Init Tracker for {cam_id}")
-            device = 'cuda' if torch.cuda.is_available() else 'cpu'
-            print(f"   👉 Device: {device}")
-            model = YOLO("yolov8n.pt")
-            # 模型预热 (Warmup) 消除首帧卡顿
-            try:
-                model(np.zeros((640, 640, 3), dtype=np.uint8), device=device, verbose=False)
-            except: pass
-            YOLO_MODELS[cam_id] = model
-        return YOLO_MODELS[cam_id]
+def detector_device():
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+def init_global_resources():
+    global PERF_LOGGER, DETECTOR
+    PERF_LOGGER = MetricLogger(LOG_DIR, fmt=LOG_FORMAT) # 启动日志记录器
+    # 多进程模式：检测器在推理进程、车牌模型在各 worker 进程里加载
+    if PROCESS_TIER: return
+    init_lpr_model()
+    device = detector_device()
+    print(f"🔄 [YOLO] Loading shared detector on {device}")
+    DETECTOR = create_detector(weights="yolov8n.pt", imgsz=INFER_IMGSZ, conf=0.5, classes=[2,3,5,7], device=device)
+    # 启动时预热一次 (按最大批)，之后新摄像头加入不会再卡在模型加载上
+    warmup(DETECTOR, imgsz=INFER_IMGSZ, batch=BATCH_MAX_FRAMES if MICRO_BATCH else 1)
+    print(f"✅ [Init] Detector ready" + (f" (batch {BATCH_MAX_FRAMES} / {BATCH_WINDOW_MS}ms)" if MICRO_BATCH else ""))
+
+def get_tracker(cam_id):
+    tracker = TRACKERS.get(cam_id)
+    if tracker is None:
+        print(f"🔄 [YOLO] Init Tracker for {cam_id}")
+        tracker = TRACKERS[cam_id] = create_tracker()
+    return tracker
 
 # === 5. 核心处理线程 ===
-def process_frame_thread(meta_data_json, jpg_bytes):
-    t_start = time.time()
+def decode_jpeg(jpg_frame):
+    """jpg_frame: recv(copy=False) 得到的 zmq.Frame (或 bytes)，返回 DecodedFrame"""
+    buf = jpg_frame.buffer if isinstance(jpg_frame, zmq.Frame) else jpg_frame
+    if not len(buf): return None
+    return DECODER.decode_for(buf, INFER_IMGSZ)
+
+def make_batch_handler(executor, shards):
+    """
+    微批处理：批内并行解码 (保持顺序) -> 一次批量检测 -> 按到达顺序推进各摄像头跟踪器，
+    分析与 LPR 交给该摄像头所在的分片 (同一路串行有序)。batch 元素为 (meta, jpg_bytes, t_recv)。
+    """
+    def handle(batch):
+        decoded = list(executor.map(decode_jpeg, [jpg for _, jpg, _ in batch]))
+        frames = [(meta, df, t_recv) for (meta, _, t_recv), df in zip(batch, decoded) if df is not None]
+        if not frames: return
+        dets = DETECTOR.detect([df.img for _, df, _ in frames], imgsz=INFER_IMGSZ)
+        for (meta, df, t_recv), det in zip(frames, dets):
+            cam_id = meta.get("cam_id", "UNK")
+            # 降分辨率解码时检测框换算回原图坐标，测速 / 回传 / 裁剪都用原图坐标
+            det.xyxy = df.to_full(det.xyxy)
+            tracks = update_tracker(get_tracker(cam_id), det, df.img)
+            shards.submit(cam_id, analyze_frame, meta, df, tracks, t_recv)
+    return handle
+
+def analyze(meta_data_json, frame, tracks, t_start, dropped=0):
+    """跟踪结果 -> 测速 / 车牌，返回 (response, 本帧车牌) (frame: jpeg_decode.DecodedFrame)"""
     cam_id = meta_data_json.get("cam_id", "UNK")
     pi_cpu = meta_data_json.get("pi_cpu", 0.0)
-
-    try:
-        if not jpg_bytes: return
-        nparr = np.frombuffer(jpg_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if img is None: return
-    except: return
-
-    # 2. 推理
-    model = get_yolo_model(cam_id)
-    # verbose=False 关闭日志能稍微提升速度
-    results = model.track(img, classes=[2,3,5,7], conf=0.5, persist=True, verbose=False)
-    
     tracks_list = []
     
     if cam_id not in ANALYSTS: ANALYSTS[cam_id] = TrafficAnalyst()
     analyst = ANALYSTS[cam_id]
     
-    current_flow = 0
     total_speed = 0
     vehicle_count = 0
     final_plate_log = "--"
 
-    for r in results:
-        if r.boxes.id is None: continue 
-        
-        boxes = r.boxes.xyxy.cpu().numpy()
-        ids = r.boxes.id.cpu().numpy()
+    if len(tracks) > 0:
+        boxes = tracks[:, :4]
+        ids = tracks[:, 4]
         
-        h, w, _ = img.shape
+        h, w = frame.full_shape
         center_y_min, center_y_max = h * 0.3, h * 0.7 # 定义黄金识别区域
 
         for box, track_id in zip(boxes, ids):
@@ -231,8 +264,9 @@ def process_frame_thread(meta_data_json, jpg_bytes):
             # 才运行 OCR
             if known_plate == "--" and (x2 - x1) > 100 and (center_y_min < cy < center_y_max):
                 pad = 10
-                roi = img[max(0,y1-pad):min(h,y2+pad), max(0,x1-pad):min(w,x2+pad)]
-                if roi.size > 0:
+                # 全分辨率裁剪 (降分辨率解码时本帧首次裁剪才解码原图)
+                roi = frame.crop(max(0,x1-pad), max(0,y1-pad), min(w,x2+pad), min(h,y2+pad))
+                if roi is not None and roi.size > 0:
                     try:
                         res = LPR_MODEL(roi)
                         # 提高置信度阈值，减少误读
@@ -241,9 +275,8 @@ def process_frame_thread(meta_data_json, jpg_bytes):
                     except: pass
             
             # 更新状态 (如果 plate_text 是 "--"，update 内部会自动保留历史 known_plate)
-            speed, current_id_plate, flow = analyst.update(track_id, (x1,y1,x2,y2), plate_text)
+            speed, current_id_plate, _ = analyst.update(track_id, (x1,y1,x2,y2), plate_text)
             
-            current_flow = flow
             if speed > 0:
                 total_speed += speed
                 vehicle_count += 1
@@ -253,26 +286,101 @@ def process_frame_thread(meta_data_json, jpg_bytes):
             tracks_list.append([x1, y1, x2, y2, track_id, current_id_plate, speed])
 
     avg_spd = int(total_speed / vehicle_count) if vehicle_count > 0 else 0
+    flow_rate = analyst.flow.snapshot(time.time())
+    current_flow = flow_rate["total"]
     latency = (time.time() - t_start) * 1000
-    
-    PERF_LOGGER.log(cam_id, pi_cpu, latency, len(tracks_list), avg_spd, current_flow, final_plate_log, RESULT_QUEUE.qsize())
 
     response = {
         "cam_id": cam_id,
         "tracks": tracks_list,
         "flow": current_flow,
+        "flow_rate": flow_rate,   # 最近 1m / 15m / 1h 车辆数及累计去重总数
         "avg_spd": avg_spd,
         "pi_cpu": pi_cpu,
         "latency_ms": latency,
+        "dropped": dropped,       # 该路累计丢弃帧数 (被新帧替换 / 超过截止时间)
         "offload_ratio": 0 
     }
+    return response, final_plate_log
+
+def log_result(response, plate, backlog):
+    PERF_LOGGER.log(response["cam_id"], response["pi_cpu"], response["latency_ms"], len(response["tracks"]),
+                    response["avg_spd"], response["flow"], plate, backlog, response["dropped"])
+
+def analyze_frame(meta_data_json, frame, tracks, t_start):
+    """线程模式：分析 -> 日志 -> 回传结果"""
+    cam_id = meta_data_json.get("cam_id", "UNK")
+    response, plate = analyze(meta_data_json, frame, tracks, t_start, ADMISSION.dropped(cam_id))
+    log_result(response, plate, RESULT_QUEUE.qsize())
+
+    # 图像缓冲归还给解码池 (LPR 裁剪图只在上面同步使用)
+    frame.release()
     
     try: RESULT_QUEUE.put(response, timeout=0.01) # 缩短 timeout
     except: pass
 
+def tier_dispatch_loop(tier):
+    """多进程模式：准入队列 -> 共享内存槽 (槽满时等待，期间同一路的新帧仍在准入队列里替换旧帧)"""
+    while True:
+        try: meta, jpg, t_recv = ADMISSION.get(timeout=0.5)
+        except Empty: continue
+        cam_id = meta.get("cam_id", "UNK")
+        buf = jpg.buffer if isinstance(jpg, zmq.Frame) else jpg
+        if not tier.submit(cam_id, buf, meta, t_recv, ADMISSION.dropped(cam_id), timeout=FRAME_BUDGET_MS / 1000.0):
+            print(f"\n⚠️ [Tier] {cam_id}: no free slot, frame dropped")
+
+def tier_collect_loop(tier):
+    """多进程模式：worker 的分析结果 -> 日志 + 回传队列"""
+    while True:
+        response, plate = tier.result_q.get()
+        log_result(response, plate, tier.backlog())
+        try: RESULT_QUEUE.put(response, timeout=0.01)
+        except: pass
+
+def start_process_tier():
+    barrier = ReadyBarrier()
+    cfg = {"model": "yolov8n.pt", "imgsz": INFER_IMGSZ, "conf": 0.5, "classes": [2,3,5,7],
+           "device": detector_device(), "max_batch": BATCH_MAX_FRAMES if MICRO_BATCH else 1,
+           "batch_window": BATCH_WINDOW_MS / 1000.0 if MICRO_BATCH else 0}
+    tier = ProcessTier(TIER_WORKERS, cfg, (init_lpr_model, analyze), n_slots=TIER_SLOTS, barrier=barrier)
+    print(f"⚙️  Process Tier: 1 inference + {tier.n_workers} workers, {TIER_SLOTS} slots")
+    barrier.wait(timeout=READY_TIMEOUT)
+    threading.Thread(target=tier_dispatch_loop, args=(tier,), daemon=True).start()
+    threading.Thread(target=tier_collect_loop, args=(tier,), daemon=True).start()
+    return tier
+
+def sched_stats_loop():
+    """定期导出按优先级类的排队统计 (JSON 文件 + 控制台)"""
+    path = os.path.join(LOG_DIR, "scheduler_stats.json")
+    while True:
+        time.sleep(SCHED_STATS_INTERVAL)
+        snap = ADMISSION.class_snapshot()
+        try:
+            with open(path + ".tmp", "w") as f: json.dump({"time": time.time(), "classes": snap}, f)
+            os.replace(path + ".tmp", path)
+        except Exception as e: print(f"Sched Stats Error: {e}")
+        print("\n📈 [Sched] " + " | ".join(
+            f"{c}: served {st['served']} drop {st['superseded'] + st['expired']} wait p95 {st.get('wait_p95_ms', 0):.0f}ms"
+            for c, st in sorted(snap.items())))
+
+def send_results(sender, results):
+    """同时就绪的多条结果一次发出 (JSON 模式保持逐条发送)"""
+    if RESULT_FORMAT == "binary":
+        sender.send_multipart(encode_batch(results, KIND_LPR), zmq.DONTWAIT)
+    else:
+        for res in results: sender.send_json(res, zmq.DONTWAIT)
+
+def print_status(results):
+    # 简化控制台日志
+    res = results[-1]
+    print(f"\r⚡ {res['cam_id']} | LAT:{res['latency_ms']:3.0f}ms | SPD:{res['avg_spd']} | FLOW:{res['flow']} | DROP:{res['dropped']}", end="")
+
 # === 6. 主循环 ===
 def main():
     print(f"🚀 PC Cloud Service Starting...")
+    if PROCESS_TIER:
+        # 必须在创建任何进程 / 队列之前设置启动方式；forkserver 预导入本模块及检测 / 跟踪依赖
+        print(f"⚙️  Start method: {use_warm_start(['__main__', 'numpy', 'cv2', 'detector', 'tracking'])}")
     init_global_resources()
     
     context = zmq.Context()
@@ -281,41 +389,51 @@ def main():
     
     sender = context.socket(zmq.PUSH)
     sender.connect(f"tcp://{PI_IP}:{PUSH_PORT}")
+    # 专用发送线程阻塞在结果队列上，结果一就绪立即发回树莓派 (不再等主循环的 poll 周期)；
+    # 此后 sender 只由该线程使用
+    dispatcher = ResultDispatcher(lambda results: send_results(sender, results), q=RESULT_QUEUE,
+                                  batch_max=RESULT_BATCH_MAX, on_sent=print_status)
     
     poller = zmq.Poller()
     poller.register(receiver, zmq.POLLIN)
     
     # 线程池大小建议：物理核数 + 2
     max_workers = psutil.cpu_count(logical=True) + 2
-    print(f"⚙️  Thread Pool: {max_workers} workers")
+    tier = start_process_tier() if PROCESS_TIER else None
+    threading.Thread(target=sched_stats_loop, daemon=True).start()
 
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if tier is None:
+            print(f"⚙️  Thread Pool: {max_workers} workers")
+            # 按摄像头分片：每路摄像头固定由一个线程顺序处理 (跟踪器 / 分析器无锁、不乱序)
+            shards = ShardedExecutor(n_shards=min(max_workers, SHARD_THREADS), name="cam")
+            print(f"⚙️  Camera Shards: {shards.n_shards} threads")
+            # 接收 -> 准入队列 (每路最新一帧) -> 调度线程 (微批或逐帧检测)
+            batcher = MicroBatcher(make_batch_handler(executor, shards), q=ADMISSION,
+                                   max_batch=BATCH_MAX_FRAMES if MICRO_BATCH else 1,
+                                   window=BATCH_WINDOW_MS / 1000.0 if MICRO_BATCH else 0)
+            submit = batcher.submit
+        else:
+            # 接收 -> 准入队列 -> 派发线程 -> 进程层
+            submit = ADMISSION.put_nowait
         while True:
             try:
-                socks = dict(poller.poll(10))
+                # 主循环只负责收帧，poll 超时只影响 Ctrl+C 响应
+                socks = dict(poller.poll(100))
                 if receiver in socks:
                     try:
-                        # 接收 Multipart 消息
+                        # 接收 Multipart 消息 (图像帧不拷贝，解码时直接读消息缓冲区)
                         meta = receiver.recv_json(zmq.SNDMORE)
-                        img = receiver.recv(0)
-                        executor.submit(process_frame_thread, meta, img)
+                        img = receiver.recv(0, copy=False)
+                        submit((meta, img, time.time()))
                     except Exception as e:
                         print(f"Recv Error: {e}")
-
-                # 发送结果回树莓派
-                while True:
-                    try:
-                        res = RESULT_QUEUE.get_nowait()
-                        sender.send_json(res, zmq.DONTWAIT)
-                        
-                        # 简化控制台日志
-                        print(f"\r⚡ {res['cam_id']} | LAT:{res['latency_ms']:3.0f}ms | SPD:{res['avg_spd']} | FLOW:{res['flow']}", end="")
-                        
-                        RESULT_QUEUE.task_done()
-                    except Empty: break
                         
             except KeyboardInterrupt: break
             except Exception: time.sleep(0.1)
 
+    dispatcher.stop()
+    if tier is not None: tier.close()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,6 +1,4 @@
 import cv2
-import time
-import json
 import socket
 import imagezmq
 import psutil
@@ -8,6 +6,9 @@ import threading
 import numpy as np
 import os
 from flask import Flask, Response, jsonify, render_template_string
+from result_codec import decode_batch
+from mjpeg_hub import LatestFrame, MjpegHub, MJPEG_MIMETYPE
+from capture import VideoReader
 
 # ⚠️ 修改为你的 PC IP
 CLOUD_IP = "192.168.137.1" 
@@ -23,6 +24,7 @@ VIDEOS = [
 
 FRAME_W, FRAME_H = 640, 360
 VIDEO_READ_SKIP = 1 # 保证流畅度
+PLAYBACK_SPEED = VIDEO_READ_SKIP + 1
 
 # 全局数据缓存
 global_frames = {}
@@ -30,7 +32,7 @@ global_data = {}
 
 # 初始化缓存，防止前端读取空数据报错
 for i in range(4): 
-    global_frames[i] = np.zeros((FRAME_H, FRAME_W, 3), dtype=np.uint8)
+    global_frames[i] = LatestFrame(np.zeros((FRAME_H, FRAME_W, 3), dtype=np.uint8))
     global_data[str(i)] = { # 注意这里 key 是字符串 "0", "1"... 方便 JS 读取
         "tracks": [],
         "metrics": {"idx":0, "status":"WAIT", "avg_spd":0, "plate":"--", "logs":[]},
@@ -44,38 +46,32 @@ def cloud_client_thread(index, video_path):
     sender = imagezmq.ImageSender(connect_to=f'tcp://{CLOUD_IP}:5555', REQ_REP=True)
     sender.zmq_socket.setsockopt(imagezmq.zmq.RCVTIMEO, 800) 
     
-    cap = cv2.VideoCapture(video_path)
+    # 1. 独立读取线程直接写入视频缓存 (纯视频)，发送阻塞时画面也不会卡住
+    reader = VideoReader(video_path, size=(FRAME_W, FRAME_H), skip=VIDEO_READ_SKIP,
+                         speed=PLAYBACK_SPEED, slot=global_frames[index]).start()
     frame_cnt = 0
+    last_seq = 0
     
     while True:
-        # 物理加速
-        for _ in range(VIDEO_READ_SKIP): cap.read()
-        ret, frame = cap.read()
-        
-        if not ret:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            continue
-            
-        frame = cv2.resize(frame, (FRAME_W, FRAME_H))
+        # 物理加速 (读取线程里 grab 跳帧)
+        got = reader.wait_newer(last_seq, timeout=1.0)
+        if got is None: continue
+        last_seq, _, frame = got
         frame_cnt += 1
         
-        # 1. 存入视频缓存 (纯视频)
-        global_frames[index] = frame
-        
         # 2. 发送给 PC (每3帧发一次)
         if frame_cnt % 3 == 0:
             ret, jpg_buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 50])
             try:
                 reply = sender.send_jpg(cam_id, jpg_buffer)
                 # 更新全局数据
-                data = json.loads(reply.decode('utf-8'))
+                data = decode_batch(reply)[0]   # 二进制结果或旧 JSON
                 global_data[str(index)] = data # 使用字符串索引
                 if frame_cnt % 30 == 0: 
                     print(f"✅ {cam_id} Linked! PC-CPU: {data.get('pc_cpu')}%")
             except Exception as e: 
                 # === 这里会告诉你为什么连不上 ===
                 print(f"❌ {cam_id} Link Error: {e}")        
-        time.sleep(0.02)
 
 app = Flask(__name__)
 
@@ -298,16 +294,12 @@ def get_data():
         global_data[k]['pi_cpu'] = pi_load
     return jsonify(global_data)
 
-def generate(index):
-    while True:
-        frame = global_frames[index]
-        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 60])
-        yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-        time.sleep(0.04)
+# 每路只编码一次，多个浏览器共享同一份 JPEG
+FEED_HUB = MjpegHub(lambda idx: global_frames.get(idx), quality=60)
 
 @app.route('/feed/<int:idx>')
 def feed(idx):
-    return Response(generate(idx), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(FEED_HUB.stream(idx), mimetype=MJPEG_MIMETYPE)
 
 if __name__ == '__main__':
     for i in range(4):
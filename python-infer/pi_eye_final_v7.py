@@ -1,6 +1,5 @@
 import cv2
 import time
-import json
 import socket
 import imagezmq
 import psutil
@@ -8,6 +7,8 @@ import threading
 import numpy as np
 import os
 from flask import Flask, Response, jsonify, render_template_string
+from result_codec import decode_batch
+from mjpeg_hub import LatestFrame, MjpegHub, MJPEG_MIMETYPE
 
 # ⚠️ 修改为你的 PC IP
 CLOUD_IP = "192.168.137.1" 
@@ -28,7 +29,7 @@ global_frames = {}
 global_data = {}
 
 for i in range(4): 
-    global_frames[i] = np.zeros((FRAME_H, FRAME_W, 3), dtype=np.uint8)
+    global_frames[i] = LatestFrame(np.zeros((FRAME_H, FRAME_W, 3), dtype=np.uint8))
     global_data[str(i)] = {}
 
 def cloud_client_thread(index, video_path):
@@ -48,13 +49,13 @@ def cloud_client_thread(index, video_path):
             
         frame = cv2.resize(frame, (FRAME_W, FRAME_H))
         frame_cnt += 1
-        global_frames[index] = frame
+        global_frames[index].publish(frame)
         
         if frame_cnt % 3 == 0:
             ret, jpg_buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 50])
             try:
                 reply = sender.send_jpg(cam_id, jpg_buffer)
-                data = json.loads(reply.decode('utf-8'))
+                data = decode_batch(reply)[0]   # 二进制结果或旧 JSON
                 global_data[str(index)] = data
             except: pass
         time.sleep(0.02)
@@ -224,16 +225,12 @@ def get_data():
         payload[str(i)] = data
     return jsonify(payload)
 
-def generate(index):
-    while True:
-        frame = global_frames[index]
-        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-        yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-        time.sleep(0.04)
+# 每路只编码一次，多个浏览器共享同一份 JPEG
+FEED_HUB = MjpegHub(lambda idx: global_frames.get(idx), quality=70)
 
 @app.route('/feed/<int:idx>')
 def feed(idx):
-    return Response(generate(idx), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(FEED_HUB.stream(idx), mimetype=MJPEG_MIMETYPE)
 
 if __name__ == '__main__':
     for i in range(4):
@@ -0,0 +1,231 @@
+# 多进程执行层 (Process Tier)
+# 线程模式下解码、跟踪、测速分析、构造 JSON 都在同一个进程里抢 GIL，摄像头一多 CPU 核用不满。
+# 这里把它们拆到多个进程：
+#   主进程:   收帧 -> JPEG 拷进空闲共享内存槽 -> 按摄像头派给固定的 worker (只传槽号 + 元数据)
+#   worker:   JPEG 降分辨率解码到槽内图像区 -> 通知推理进程 -> 收到检测框后跟踪 + 分析 -> 结果回主进程 -> 归还槽
+#   推理进程: 微批收集各 worker 的就绪槽 -> 一次批量检测 -> 检测框写回槽 -> 通知对应 worker
+# 同一路摄像头固定由一个 worker 处理，跟踪器 / 分析器状态只在该进程内，仍然按帧顺序推进。
+import math
+import time
+import queue
+import multiprocessing as mp
+import numpy as np
+from multiprocessing import shared_memory
+
+from detector import Detections, MAX_DETS, create_detector, warmup
+from tracking import create_tracker, update_tracker
+from jpeg_decode import JpegDecoder, DecodedFrame, decode_into, jpeg_size, reduce_factor
+
+# 头部字段: jpeg_len, img_h, img_w, n_det
+HEADER_FIELDS = 4
+# 每个检测: x1, y1, x2, y2, conf, cls (推理图坐标)
+DET_COLS = 6
+
+
+class FrameSlots:
+    """n_slots 个帧槽 [header | JPEG 字节 | 推理图像 (扁平) | 检测结果]，各进程映射同一块共享内存"""
+    def __init__(self, name, n_slots, max_jpeg, max_pixels, create=False):
+        self.name = name
+        self.args = (name, n_slots, max_jpeg, max_pixels)
+        sizes = [n_slots * HEADER_FIELDS * 8, n_slots * max_jpeg, n_slots * max_pixels * 3,
+                 n_slots * MAX_DETS * DET_COLS * 4]
+        if create:
+            try: shared_memory.SharedMemory(name=name).unlink()
+            except: pass
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=sum(sizes))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        buf, off = self.shm.buf, np.cumsum([0] + sizes)
+        self.header = np.ndarray((n_slots, HEADER_FIELDS), dtype=np.int64, buffer=buf, offset=off[0])
+        self.jpeg = np.ndarray((n_slots, max_jpeg), dtype=np.uint8, buffer=buf, offset=off[1])
+        self.pixels = np.ndarray((n_slots, max_pixels * 3), dtype=np.uint8, buffer=buf, offset=off[2])
+        self.dets = np.ndarray((n_slots, MAX_DETS, DET_COLS), dtype=np.float32, buffer=buf, offset=off[3])
+        if create: self.header[:] = 0
+
+    def jpeg_view(self, i):
+        return self.jpeg[i, :self.header[i, 0]]
+
+    def image(self, i):
+        h, w = int(self.header[i, 1]), int(self.header[i, 2])
+        return self.pixels[i, :h * w * 3].reshape(h, w, 3)
+
+    def close(self):
+        # 先释放 numpy 视图，否则 SharedMemory.close 会报 BufferError
+        self.header = self.jpeg = self.pixels = self.dets = None
+        self.shm.close()
+
+    def unlink(self):
+        try: self.shm.unlink()
+        except: pass
+
+
+def _fit_factor(h, w, imgsz, max_pixels):
+    """在推理尺寸要求的倍数基础上，继续加大缩放直到放得进槽"""
+    f = reduce_factor(h, w, imgsz)
+    while f < 8 and math.ceil(h / f) * math.ceil(w / f) > max_pixels: f *= 2
+    return f
+
+
+def tier_inference_process(slot_args, infer_q, inboxes, cfg, ready_event=None):
+    """
+    推理进程：只做批量检测。
+    cfg: {"model", "imgsz", "conf", "classes", "device", "backend", "max_batch", "batch_window"}
+    """
+    slots = FrameSlots(*slot_args)
+    imgsz = cfg.get("imgsz", 640)
+    max_batch = cfg.get("max_batch", 8)
+    window = cfg.get("batch_window", 0.005)
+    print("Process Tier: Loading detector...", end="", flush=True)
+    detector = create_detector(cfg.get("backend"), weights=cfg.get("model", "yolov8n.pt"), imgsz=imgsz,
+                               conf=cfg.get("conf", 0.25), classes=cfg.get("classes"), device=cfg.get("device"))
+    warmup(detector, imgsz, batch=max_batch)
+    print("Done.")
+    if ready_event is not None: ready_event.set()
+
+    while True:
+        try: batch = [infer_q.get(timeout=1.0)]
+        except queue.Empty: continue
+        deadline = time.perf_counter() + window
+        while len(batch) < max_batch:
+            remaining = deadline - time.perf_counter()
+            try: batch.append(infer_q.get(timeout=remaining) if remaining > 0 else infer_q.get_nowait())
+            except queue.Empty: break
+
+        try:
+            results = detector.detect([slots.image(i) for i, _ in batch], imgsz=imgsz)
+        except Exception as e:
+            print(f"Inference Error: {e}")
+            results = [Detections.empty()] * len(batch)
+
+        for (i, worker), det in zip(batch, results):
+            n = min(len(det), MAX_DETS)
+            if n:
+                slots.dets[i, :n, :4] = det.xyxy[:n]
+                slots.dets[i, :n, 4] = det.conf[:n]
+                slots.dets[i, :n, 5] = det.cls[:n]
+            slots.header[i, 3] = n
+            inboxes[worker].put(("det", i))
+
+
+def tier_worker_process(idx, slot_args, inbox, infer_q, free_q, result_q, imgsz, hooks, ready_event=None):
+    """
+    worker 进程：解码 + 跟踪 + 分析。
+    hooks: (init_fn, analyze_fn)，需为模块级函数 (可 pickle)；
+           init_fn() 在进程内加载分析所需模型，analyze_fn(meta, frame, tracks, t_recv, dropped) 的返回值发回主进程
+    """
+    init_fn, analyze_fn = hooks
+    slots = FrameSlots(*slot_args)
+    max_pixels = slot_args[3]
+    decoder = JpegDecoder()    # 只用于 LPR 的全分辨率解码
+    trackers = {}
+    pending = {}               # slot -> (cam_id, meta, t_recv, dropped, full_shape, factor)
+    if init_fn is not None: init_fn()
+    if ready_event is not None: ready_event.set()
+
+    while True:
+        msg = inbox.get()
+        if msg is None: break
+        if msg[0] == "frame":
+            _, i, cam_id, meta, t_recv, dropped = msg
+            buf = slots.jpeg_view(i)
+            size = jpeg_size(buf)
+            img = None
+            if size is not None:
+                factor = _fit_factor(size[0], size[1], imgsz, max_pixels)
+                img = decode_into(buf, factor, slots.pixels[i])
+            if img is None:
+                free_q.put(i)
+                continue
+            slots.header[i, 1:3] = img.shape[:2]
+            pending[i] = (cam_id, meta, t_recv, dropped, size, factor)
+            infer_q.put((i, idx))
+            continue
+
+        # ("det", slot)：检测完成
+        i = msg[1]
+        cam_id, meta, t_recv, dropped, size, factor = pending.pop(i)
+        try:
+            n = int(slots.header[i, 3])
+            d = slots.dets[i, :n]
+            det = Detections(d[:, :4], d[:, 4], d[:, 5])
+            frame = DecodedFrame(decoder, slots.jpeg_view(i), slots.image(i), size, factor)
+            det.xyxy = frame.to_full(det.xyxy)
+            tracker = trackers.get(cam_id)
+            if tracker is None: tracker = trackers[cam_id] = create_tracker()
+            tracks = update_tracker(tracker, det, frame.img)
+            result = analyze_fn(meta, frame, tracks, t_recv, dropped)
+            frame.release()
+            result_q.put(result)
+        except Exception as e:
+            print(f"Tier Worker {idx} Error: {e}")
+        finally:
+            free_q.put(i)
+
+
+class ProcessTier:
+    """
+    主进程侧：启动推理进程 + n_workers 个 worker，submit() 把一帧 JPEG 放进共享内存槽并派发，
+    分析结果从 result_q 取。
+    max_image: 槽内推理图像的最大尺寸 (h, w)，原图解码后放不下时自动加大缩放倍数
+    """
+    def __init__(self, n_workers, cfg, hooks, n_slots=32, max_jpeg=1 << 20, max_image=(720, 1280),
+                 name="psm_tier", barrier=None):
+        self.n_workers = max(1, n_workers)
+        self.n_slots = n_slots
+        self.slots = FrameSlots(name, n_slots, max_jpeg, max_image[0] * max_image[1], create=True)
+        slot_args = self.slots.args
+
+        self.free_q = mp.Queue()
+        for i in range(n_slots): self.free_q.put(i)
+        self.infer_q = mp.Queue()
+        self.result_q = mp.Queue()
+        self.inboxes = [mp.Queue() for _ in range(self.n_workers)]
+        self.worker_of = {}
+        self.processes = []
+
+        def start(label, target, args):
+            ev = barrier.event(label) if barrier is not None else None
+            p = mp.Process(target=target, args=args + (ev,), daemon=True)
+            p.start()
+            if barrier is not None: barrier.watch(label, p)
+            self.processes.append(p)
+
+        start("Tier Inference", tier_inference_process, (slot_args, self.infer_q, self.inboxes, cfg))
+        for w in range(self.n_workers):
+            start(f"Tier Worker {w + 1}", tier_worker_process,
+                  (w, slot_args, self.inboxes[w], self.infer_q, self.free_q, self.result_q,
+                   cfg.get("imgsz", 640), hooks))
+
+    def _worker(self, cam_id):
+        w = self.worker_of.get(cam_id)
+        if w is None: w = self.worker_of[cam_id] = len(self.worker_of) % self.n_workers
+        return w
+
+    def submit(self, cam_id, buf, meta, t_recv, dropped=0, timeout=None):
+        """
+        等待空闲槽 (最多 timeout 秒)，把 JPEG 拷进槽并派给该摄像头的 worker。
+        没有空闲槽或 JPEG 超过槽容量时返回 False
+        """
+        try: i = self.free_q.get(timeout=timeout)
+        except queue.Empty: return False
+        data = np.frombuffer(buf, np.uint8)
+        if len(data) > self.slots.jpeg.shape[1]:
+            self.free_q.put(i)
+            return False
+        self.slots.jpeg[i, :len(data)] = data
+        self.slots.header[i, 0] = len(data)
+        self.inboxes[self._worker(cam_id)].put(("frame", i, cam_id, meta, t_recv, dropped))
+        return True
+
+    def backlog(self):
+        """处理中的帧数 (已占用的槽)"""
+        try: return self.n_slots - self.free_q.qsize()
+        except NotImplementedError: return 0
+
+    def close(self):
+        for q in self.inboxes: q.put(None)
+        for p in self.processes:
+            if p.is_alive(): p.terminate()
+        self.slots.close()
+        self.slots.unlink()
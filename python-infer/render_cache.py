@@ -0,0 +1,39 @@
+# 仪表盘绘制缓存
+# 静态图层 (色带、面板底图、标签) 只生成一次；每帧只对受影响的 ROI 做混合，
+# 文字块按内容缓存，内容不变时直接拷贝像素，不再整幅 copy + addWeighted。
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+
+class TintBand:
+    """预生成的纯色半透明矩形，只与目标图像的 ROI 混合 (原地写回)"""
+    def __init__(self, rect, color, alpha):
+        x1, y1, x2, y2 = rect
+        self.rect = (x1, y1, x2, y2)
+        self.alpha = alpha
+        self.layer = np.full((y2 - y1, x2 - x1, 3), color, dtype=np.uint8)
+
+    def apply(self, img):
+        x1, y1, x2, y2 = self.rect
+        roi = img[y1:y2, x1:x2]
+        h, w = roi.shape[:2]
+        if h == 0 or w == 0: return
+        cv2.addWeighted(self.layer[:h, :w], self.alpha, roi, 1 - self.alpha, 0, dst=roi)
+
+
+class PatchCache:
+    """按内容 key 缓存渲染好的小图块 (面板、车牌等)，LRU 淘汰"""
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.patches = OrderedDict()
+
+    def get(self, key, render):
+        patch = self.patches.get(key)
+        if patch is None:
+            patch = render()
+            self.patches[key] = patch
+            if len(self.patches) > self.maxsize: self.patches.popitem(last=False)
+        else:
+            self.patches.move_to_end(key)
+        return patch
@@ -0,0 +1,160 @@
+# 结果二进制协议 (Result Codec)
+# 替代逐条 JSON：轨迹打包成 16 字节定长记录，车牌 / 状态 / 日志等字符串放进一张按批去重的字符串表，
+# 同时就绪的多条结果合并成一次 multipart 发送。
+#
+# 一批 = [批头帧, 结果帧 1, 结果帧 2, ...]；REQ/REP 回复等只能发一帧的场合可直接拼成一个 bytes。
+#   批头: magic "RR" | version u8 | kind u8 | n_results u16 | n_strings u16 | 各字符串长度 u16[] | UTF-8 字节
+#   结果: 该 kind 的定长标量 (含 n_tracks) | 16 字节定长轨迹 x n_tracks | kind 特有的变长尾部
+# 解码端按首字节识别：b"{" 按旧 JSON 解析，因此 JSON 发送端 (RESULT_FORMAT="json") 仍可混用。
+import json
+import struct
+
+MAGIC = b"RR"
+VERSION = 1
+
+KIND_LPR = 1     # pc_cloud_lpr_service -> Pi (PUSH)
+KIND_EDGE = 2    # cloud_server -> pi_edge_client (REQ/REP 回复)
+
+NO_STR = 0xFFFF
+NO_SPEED = -1
+
+_HEAD = struct.Struct("<2sBBHH")
+# 每条轨迹 16 字节: x1, y1, x2, y2 (int16，足够 4K 且允许越界的负坐标), track_id u32,
+# label u16 (字符串表下标，车牌), speed i16
+_TRACK = struct.Struct("<hhhhIHh")
+# n_tracks, cam, flow, flow_1m, flow_15m, flow_1h, avg_spd, pi_cpu, latency_ms, offload_ratio, dropped
+_LPR = struct.Struct("<HHIIIIhfffI")
+# n_tracks, status, plate, env_time, env_weather, n_logs, triggered, avg_spd, idx, pc_cpu
+_EDGE = struct.Struct("<HHHHHBBhff")
+
+
+class _Strings:
+    """批内字符串表：相同字符串只存一次"""
+    def __init__(self):
+        self.index = {}
+        self.items = []
+
+    def __call__(self, s):
+        s = str(s)
+        i = self.index.get(s)
+        if i is None:
+            i = self.index[s] = len(self.items)
+            self.items.append(s.encode("utf-8"))
+        return i
+
+
+def _int(v):
+    return int(v) if v is not None else 0
+
+
+# ================= KIND_LPR =================
+def _pack_lpr(r, strings):
+    tracks = r.get("tracks") or []
+    body = b"".join([_TRACK.pack(x1, y1, x2, y2, tid, strings(plate), spd)
+                     for x1, y1, x2, y2, tid, plate, spd in tracks])
+    rate = r.get("flow_rate") or {}
+    head = _LPR.pack(len(tracks), strings(r.get("cam_id", "UNK")), _int(r.get("flow")),
+                     _int(rate.get("1m")), _int(rate.get("15m")), _int(rate.get("1h")), _int(r.get("avg_spd")),
+                     float(r.get("pi_cpu") or 0), float(r.get("latency_ms") or 0),
+                     float(r.get("offload_ratio") or 0), _int(r.get("dropped")))
+    return head + body
+
+
+def _tracks(buf, pos, n):
+    end = pos + n * _TRACK.size
+    return list(_TRACK.iter_unpack(buf[pos:end])), end
+
+
+def _unpack_lpr(buf, pos, strings):
+    n, cam, flow, f1m, f15m, f1h, avg, pi, lat, offload, dropped = _LPR.unpack_from(buf, pos)
+    rows, pos = _tracks(buf, pos + _LPR.size, n)
+    tracks = [[x1, y1, x2, y2, tid, strings[lab], spd] for x1, y1, x2, y2, tid, lab, spd in rows]
+    return {
+        "cam_id": strings[cam], "tracks": tracks, "flow": flow,
+        "flow_rate": {"1m": f1m, "15m": f15m, "1h": f1h, "total": flow},
+        "avg_spd": avg, "pi_cpu": pi, "latency_ms": lat, "dropped": dropped, "offload_ratio": offload,
+    }, pos
+
+
+# ================= KIND_EDGE =================
+def _pack_edge(r, strings):
+    tracks = r.get("tracks") or []
+    m = r.get("metrics") or {}
+    env = r.get("env") or {}
+    # 速度并入轨迹数组 (speeds 的 key 就是当前轨迹 ID)，没有测速结果的记 NO_SPEED
+    speeds = m.get("speeds") or {}
+    body = b"".join([_TRACK.pack(x1, y1, x2, y2, tid, NO_STR, speeds.get(tid, NO_SPEED))
+                     for x1, y1, x2, y2, tid in tracks])
+    logs = (m.get("logs") or [])[-255:]
+    head = _EDGE.pack(len(tracks), strings(m.get("status", "WAIT")), strings(m.get("plate", "--")),
+                      strings(env.get("time", "--")), strings(env.get("weather", "--")), len(logs),
+                      1 if m.get("triggered") else 0, _int(m.get("avg_spd")), float(m.get("idx") or 0),
+                      float(r.get("pc_cpu") or 0))
+    return head + body + struct.pack(f"<{len(logs)}H", *[strings(s) for s in logs])
+
+
+def _unpack_edge(buf, pos, strings):
+    n, status, plate, env_time, weather, n_logs, triggered, avg, idx, pc_cpu = _EDGE.unpack_from(buf, pos)
+    rows, pos = _tracks(buf, pos + _EDGE.size, n)
+    logs = struct.unpack_from(f"<{n_logs}H", buf, pos)
+    pos += 2 * n_logs
+    return {
+        "tracks": [[x1, y1, x2, y2, tid] for x1, y1, x2, y2, tid, _, _ in rows],
+        "metrics": {"idx": idx, "status": strings[status], "avg_spd": avg,
+                    "speeds": {tid: spd for _, _, _, _, tid, _, spd in rows if spd != NO_SPEED},
+                    "logs": [strings[i] for i in logs], "plate": strings[plate], "triggered": bool(triggered)},
+        "env": {"time": strings[env_time], "weather": strings[weather]},
+        "pc_cpu": pc_cpu,
+    }, pos
+
+
+_PACK = {KIND_LPR: _pack_lpr, KIND_EDGE: _pack_edge}
+_UNPACK = {KIND_LPR: _unpack_lpr, KIND_EDGE: _unpack_edge}
+
+
+# ================= 接口 =================
+def encode_batch(results, kind=KIND_LPR):
+    """结果字典列表 -> multipart 帧列表 [批头, 结果...] (拼成一个 bytes 也能解码)"""
+    strings = _Strings()
+    bodies = [_PACK[kind](r, strings) for r in results]
+    items = strings.items
+    head = (_HEAD.pack(MAGIC, VERSION, kind, len(bodies), len(items))
+            + struct.pack(f"<{len(items)}H", *[len(s) for s in items]) + b"".join(items))
+    return [head] + bodies
+
+
+def encode_json(results):
+    """JSON 回退格式：每条结果一帧"""
+    return [json.dumps(r).encode("utf-8") for r in results]
+
+
+def decode_batch(frames):
+    """
+    frames: 单个 bytes，或 recv_multipart 得到的帧列表 (bytes / zmq.Frame)。
+    返回结果字典列表；JSON 帧按旧格式解析。
+    """
+    if isinstance(frames, (bytes, bytearray, memoryview)): frames = [frames]
+    frames = [memoryview(getattr(f, "buffer", f)) for f in frames]
+    first = frames[0]
+    if first[:1] == b"{":
+        return [json.loads(bytes(f)) for f in frames]
+
+    magic, version, kind, n, n_str = _HEAD.unpack_from(first, 0)
+    if magic != MAGIC: raise ValueError("Not a result batch")
+    if version != VERSION: raise ValueError(f"Unsupported result version {version}")
+    pos = _HEAD.size
+    lens = struct.unpack_from(f"<{n_str}H", first, pos)
+    pos += 2 * n_str
+    strings = []
+    for size in lens:
+        strings.append(bytes(first[pos:pos + size]).decode("utf-8"))
+        pos += size
+
+    unpack = _UNPACK[kind]
+    out = []
+    for body in (frames[1:] if len(frames) > 1 else [first[pos:]]):
+        off = 0
+        while off < len(body) and len(out) < n:
+            res, off = unpack(body, off, strings)
+            out.append(res)
+    return out
@@ -0,0 +1,129 @@
+# 结果即时发送 (Result Dispatch)
+# 原来主循环在 poller.poll(10) 返回后才去取结果队列，一条算完的结果最多要等 10ms (再加上接收分支的耗时) 才发出。
+# 这里用一个专用发送线程阻塞在结果队列上：结果一入队线程就被唤醒发送，既不轮询也不忙等；
+# 同时就绪的多条结果一次取完合并发送。发送 socket 只由该线程使用 (zmq socket 不是线程安全的)。
+import time
+import queue
+import threading
+
+
+class ResultDispatcher:
+    """send_fn(results) 在发送线程里调用；q 可传入已有的 queue.Queue (生产者照常 put)"""
+    def __init__(self, send_fn, batch_max=32, maxsize=200, q=None, on_sent=None):
+        self.send_fn = send_fn
+        self.batch_max = batch_max
+        self.on_sent = on_sent
+        self.q = q if q is not None else queue.Queue(maxsize=maxsize)
+        self.sent = 0
+        self.errors = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name="result-sender", daemon=True)
+        self.thread.start()
+
+    def put(self, item, timeout=0.01):
+        try:
+            self.q.put(item, timeout=timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def qsize(self):
+        return self.q.qsize()
+
+    def stop(self):
+        self.running = False
+
+    def _loop(self):
+        while self.running:
+            try: batch = [self.q.get(timeout=0.5)]
+            except queue.Empty: continue
+            while len(batch) < self.batch_max:
+                try: batch.append(self.q.get_nowait())
+                except queue.Empty: break
+            try:
+                self.send_fn(batch)
+                self.sent += len(batch)
+                if self.on_sent is not None: self.on_sent(batch)
+            except Exception:
+                # 对端积压 (zmq.Again) 等：丢弃这一批，计数后继续
+                self.errors += 1
+
+
+# ================= 发送延迟对比 =================
+# 模拟 pc_cloud_lpr_service：若干分析线程随机时刻产出结果，接收端 (PULL) 统计 "结果就绪 -> 收到" 的延迟。
+#   poll:   原主循环 (poll(10) 收帧，返回后再取结果队列)
+#   thread: ResultDispatcher 专用发送线程
+if __name__ == "__main__":
+    import argparse
+    import zmq
+    import numpy as np
+    from result_codec import encode_batch, decode_batch
+
+    parser = argparse.ArgumentParser(description="Result dispatch latency benchmark")
+    parser.add_argument("--results", type=int, default=2000)
+    parser.add_argument("--producers", type=int, default=4)
+    parser.add_argument("--fps", type=float, default=15.0, help="results per second per producer")
+    parser.add_argument("--modes", default="poll,thread")
+    args = parser.parse_args()
+
+    T0 = time.perf_counter()
+    now_ms = lambda: (time.perf_counter() - T0) * 1000
+
+    def make_result(i):
+        # latency_ms 字段借来存就绪时刻 (相对 T0，float32 精度足够)
+        return {"cam_id": f"CAM-{i % 4 + 1:02d}", "tracks": [[10, 10, 60, 60, i, "--", 30]] * 5, "flow": i,
+                "flow_rate": {}, "avg_spd": 30, "pi_cpu": 0.0, "latency_ms": now_ms(), "dropped": 0}
+
+    def run(mode):
+        ctx = zmq.Context()
+        pull = ctx.socket(zmq.PULL)
+        port = pull.bind_to_random_port("tcp://127.0.0.1")
+        push = ctx.socket(zmq.PUSH)
+        push.connect(f"tcp://127.0.0.1:{port}")
+        # 主循环收帧用的 socket (基准里没有上游流量，poll 只会等满 10ms)
+        frames_in = ctx.socket(zmq.PULL)
+        frames_in.bind_to_random_port("tcp://127.0.0.1")
+
+        results_q = queue.Queue(maxsize=200)
+        per_producer = args.results // args.producers
+        total = per_producer * args.producers
+        latencies = []
+
+        def producer(k):
+            rng = np.random.default_rng(k)
+            for i in range(per_producer):
+                time.sleep(rng.exponential(1.0 / args.fps))
+                results_q.put(make_result(k * per_producer + i))
+
+        def receiver():
+            while len(latencies) < total:
+                for res in decode_batch(pull.recv_multipart()):
+                    latencies.append(now_ms() - res["latency_ms"])
+
+        send = lambda results: push.send_multipart(encode_batch(results))
+        recv_t = threading.Thread(target=receiver, daemon=True)
+        recv_t.start()
+        producers = [threading.Thread(target=producer, args=(k,), daemon=True) for k in range(args.producers)]
+        for t in producers: t.start()
+
+        if mode == "thread":
+            dispatcher = ResultDispatcher(send, q=results_q)
+            recv_t.join()
+            dispatcher.stop()
+        else:
+            poller = zmq.Poller()
+            poller.register(frames_in, zmq.POLLIN)
+            while recv_t.is_alive():
+                poller.poll(10)
+                batch = []
+                while True:
+                    try: batch.append(results_q.get_nowait())
+                    except queue.Empty: break
+                if batch: send(batch)
+        ctx.destroy(linger=0)
+        lat = np.array(latencies)
+        print(f"{mode:8s} n={len(lat)} p50={np.percentile(lat, 50):6.2f}ms p95={np.percentile(lat, 95):6.2f}ms "
+              f"p99={np.percentile(lat, 99):6.2f}ms max={lat.max():6.2f}ms")
+
+    for mode in args.modes.split(","):
+        run(mode)
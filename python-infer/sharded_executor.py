@@ -0,0 +1,45 @@
+# 按 key 分片的执行器 (Sharded Executor)
+# 每个分片是一个单线程 + 自己的任务队列；同一个 key (摄像头) 固定落在同一分片，
+# 因此同一路摄像头的任务严格按提交顺序串行执行，其状态 (跟踪器、分析器) 无需加锁；
+# 不同摄像头分布在不同分片上并行。
+import queue
+import threading
+
+
+class ShardedExecutor:
+    """submit(key, fn, *args)：同 key 串行有序，不同 key 并行"""
+    def __init__(self, n_shards=4, name="shard"):
+        self.n_shards = max(1, n_shards)
+        self.queues = [queue.Queue() for _ in range(self.n_shards)]
+        self.shard_of = {}
+        self.lock = threading.Lock()
+        self.threads = []
+        for i, q in enumerate(self.queues):
+            t = threading.Thread(target=self._loop, args=(q,), name=f"{name}-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def _shard(self, key):
+        shard = self.shard_of.get(key)
+        if shard is None:
+            # 新 key 轮流分配到各分片，摄像头数不多时比哈希更均匀
+            with self.lock:
+                shard = self.shard_of.setdefault(key, len(self.shard_of) % self.n_shards)
+        return shard
+
+    def submit(self, key, fn, *args):
+        self.queues[self._shard(key)].put((fn, args))
+
+    def backlog(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def shutdown(self):
+        for q in self.queues: q.put(None)
+
+    def _loop(self, q):
+        while True:
+            task = q.get()
+            if task is None: return
+            fn, args = task
+            try: fn(*args)
+            except Exception as e: print(f"Shard Task Error: {e}")
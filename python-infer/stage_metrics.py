@@ -0,0 +1,118 @@
+# 分阶段延迟直方图 (Stage Metrics)
+# 每路摄像头 × 每个处理阶段一组固定的对数分桶计数，放在共享内存里：
+# Worker (及其读取线程、LPR 服务) 只做一次 +1，不加锁 (每个格子只有一个写入方)；
+# Web 进程随时读取快照计算 p50/p95/p99，无需挂 profiler。
+import math
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+STAGES = ("decode", "resize", "track", "analyst", "lpr", "draw", "shm_copy", "e2e")
+STAGE_INDEX = {name: i for i, name in enumerate(STAGES)}
+
+# 分桶: 第 k 桶上界 = BUCKET_MIN_MS * BUCKET_FACTOR^k，覆盖 0.01ms ~ 10s，最后一桶兜底
+BUCKET_MIN_MS = 0.01
+BUCKET_FACTOR = 1.25
+N_BUCKETS = 64
+_LOG_FACTOR = math.log(BUCKET_FACTOR)
+BUCKET_EDGES_MS = BUCKET_MIN_MS * BUCKET_FACTOR ** np.arange(N_BUCKETS)
+
+
+class StageHistograms:
+    """共享内存直方图: counts (cams, stages, buckets)，sum/max (cams, stages)"""
+    def __init__(self, name, n_cams, create=False):
+        self.name = name
+        self.n_cams = n_cams
+        cells = n_cams * len(STAGES)
+        count_bytes = cells * N_BUCKETS * 8
+        size = count_bytes + cells * 8 * 2
+
+        if create:
+            try: shared_memory.SharedMemory(name=name).unlink()
+            except: pass
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        buf = self.shm.buf
+        shape = (n_cams, len(STAGES))
+        self.counts = np.ndarray(shape + (N_BUCKETS,), dtype=np.int64, buffer=buf, offset=0)
+        self.sums = np.ndarray(shape, dtype=np.float64, buffer=buf, offset=count_bytes)
+        self.maxs = np.ndarray(shape, dtype=np.float64, buffer=buf, offset=count_bytes + cells * 8)
+        if create:
+            self.counts[:] = 0
+            self.sums[:] = 0
+            self.maxs[:] = 0
+
+    def record(self, cam, stage, seconds):
+        """记录一次耗时 (stage 为阶段名或下标)"""
+        if isinstance(stage, str): stage = STAGE_INDEX[stage]
+        ms = seconds * 1000.0
+        k = 0 if ms <= BUCKET_MIN_MS else min(int(math.ceil(math.log(ms / BUCKET_MIN_MS) / _LOG_FACTOR)),
+                                               N_BUCKETS - 1)
+        self.counts[cam, stage, k] += 1
+        self.sums[cam, stage] += ms
+        if ms > self.maxs[cam, stage]: self.maxs[cam, stage] = ms
+
+    def recorder(self, cam):
+        """绑定摄像头的记录函数 rec(stage, seconds)，供读取线程等组件使用"""
+        return lambda stage, seconds: self.record(cam, stage, seconds)
+
+    def percentiles(self, cam, stage, qs=(0.5, 0.95, 0.99)):
+        """按桶内线性插值估算分位数 (ms)"""
+        counts = self.counts[cam, stage].copy()
+        total = counts.sum()
+        if total == 0: return [0.0] * len(qs)
+        cum = np.cumsum(counts)
+        out = []
+        for q in qs:
+            k = int(np.searchsorted(cum, q * total))
+            hi = BUCKET_EDGES_MS[k]
+            lo = BUCKET_EDGES_MS[k - 1] if k > 0 else 0.0
+            before = cum[k - 1] if k > 0 else 0
+            frac = (q * total - before) / counts[k] if counts[k] else 1.0
+            out.append(min(lo + (hi - lo) * frac, self.maxs[cam, stage]))
+        return out
+
+    def snapshot(self, cam_names=None):
+        """{cam: {stage: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}}}"""
+        report = {}
+        for cam in range(self.n_cams):
+            name = cam_names[cam] if cam_names else str(cam)
+            stages = {}
+            for s, stage in enumerate(STAGES):
+                n = int(self.counts[cam, s].sum())
+                if n == 0: continue
+                p50, p95, p99 = self.percentiles(cam, s)
+                stages[stage] = {
+                    "count": n,
+                    "mean_ms": round(float(self.sums[cam, s]) / n, 3),
+                    "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3),
+                    "max_ms": round(float(self.maxs[cam, s]), 3),
+                }
+            report[name] = stages
+        return report
+
+    def close(self):
+        self.counts = self.sums = self.maxs = None
+        self.shm.close()
+
+    def unlink(self):
+        try: self.shm.unlink()
+        except: pass
+
+
+class StageClock:
+    """顺序打点计时：lap(stage) 记录自上次打点以来的耗时"""
+    def __init__(self, hist, cam):
+        self.hist = hist
+        self.cam = cam
+        self.t = time.perf_counter()
+
+    def start(self):
+        self.t = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        if self.hist is not None: self.hist.record(self.cam, stage, now - self.t)
+        self.t = now
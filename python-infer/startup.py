@@ -0,0 +1,62 @@
+# 启动编排 (Startup)
+# 1. 就绪屏障：每个子进程在模型加载 + 预热推理完成后 set 自己的 Event，
+#    主进程按实际耗时等待，而不是固定 sleep 猜测。
+# 2. 热启动：优先使用 forkserver，并预加载重量级模块 (numpy / cv2 / 检测器)，
+#    子进程从已导入这些模块的 forkserver fork 出来，不再每个进程各自冷导入一遍。
+import time
+import multiprocessing as mp
+
+
+def use_warm_start(preload=()):
+    """
+    设置进程启动方式：forkserver + 预加载模块；平台不支持时回退到 spawn。
+    必须在创建任何 Process / Event / Queue 之前调用。返回实际使用的启动方式。
+    """
+    if "forkserver" in mp.get_all_start_methods():
+        mp.set_start_method("forkserver", force=True)
+        # forkserver 只导入模块，不创建线程/模型；模型在各自进程里加载
+        mp.set_forkserver_preload(list(preload))
+        return "forkserver"
+    mp.set_start_method("spawn", force=True)
+    return "spawn"
+
+
+class ReadyBarrier:
+    """按组件名登记就绪 Event，主进程统一等待并报告每个组件的启动耗时"""
+    def __init__(self):
+        self.events = {}
+        self.procs = {}
+
+    def event(self, name):
+        ev = mp.Event()
+        self.events[name] = ev
+        return ev
+
+    def watch(self, name, proc):
+        """关联进程：进程在就绪前退出时立即报告，而不是等到超时"""
+        self.procs[name] = proc
+
+    def wait(self, timeout=120.0, poll=0.1):
+        """等待所有组件就绪，返回未就绪 (超时或已退出) 的组件名列表"""
+        t0 = time.time()
+        pending = list(self.events)
+        failed = []
+        while pending:
+            for name in list(pending):
+                if self.events[name].is_set():
+                    pending.remove(name)
+                    print(f"✅ {name} ready ({time.time() - t0:.1f}s)")
+                    continue
+                proc = self.procs.get(name)
+                if proc is not None and not proc.is_alive():
+                    pending.remove(name)
+                    failed.append(name)
+                    print(f"❌ {name} exited before ready (code {proc.exitcode})")
+            if not pending: break
+            if time.time() - t0 > timeout:
+                print(f"⚠️ Not ready after {timeout:.0f}s: {', '.join(pending)}")
+                failed.extend(pending)
+                break
+            # 等待任意一个未就绪组件，避免忙轮询
+            self.events[pending[0]].wait(poll)
+        return failed
@@ -0,0 +1,122 @@
+# 数组化轨迹仓库 (Track Store)
+# 每个 track ID 映射到一个 slot，slot 下是预分配的 NumPy 环形历史缓冲。
+# 写入、测速、过线判断、过期清理都对所有活跃 track 一次性向量化完成，
+# 避免每个目标一份 Python list + pop(0) + 字典重建。
+import numpy as np
+
+
+class TrackStore:
+    """按 slot 索引的轨迹环形缓冲 (每个 track 保留最近 history 个中心点)"""
+    def __init__(self, history=5, capacity=64):
+        self.history = history
+        self.slot_of = {}   # track_id -> slot
+        self.tick = 0       # 每次 push 递增，用于判断过期
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        H = self.history
+        self.capacity = capacity
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.pts = np.zeros((capacity, H, 2), dtype=np.float32)  # cx, cy
+        self.ts = np.zeros((capacity, H), dtype=np.float64)
+        self.head = np.zeros(capacity, dtype=np.int32)           # 下一个写入位置
+        self.count = np.zeros(capacity, dtype=np.int32)          # 已有历史点数
+        self.speed = np.zeros(capacity, dtype=np.float32)
+        self.has_speed = np.zeros(capacity, dtype=bool)
+        self.seen = np.zeros(capacity, dtype=np.int64)           # 最后一次出现的 tick
+        self.active = np.zeros(capacity, dtype=bool)
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def _grow(self):
+        """容量不够时翻倍 (极少发生，摊还 O(1))"""
+        old = self.capacity
+        arrays = {k: getattr(self, k) for k in
+                  ("ids", "pts", "ts", "head", "count", "speed", "has_speed", "seen", "active")}
+        self._alloc(old * 2)
+        for k, arr in arrays.items():
+            getattr(self, k)[:old] = arr
+        self.free = list(range(self.capacity - 1, old - 1, -1))
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def slots_for(self, ids):
+        """取得 ID 对应的 slot，新 ID 分配并清零一个 slot"""
+        slots = np.empty(len(ids), dtype=np.int64)
+        fresh = []
+        for k, obj_id in enumerate(ids.tolist()):
+            slot = self.slot_of.get(obj_id)
+            if slot is None:
+                if not self.free: self._grow()
+                slot = self.free.pop()
+                self.slot_of[obj_id] = slot
+                self.ids[slot] = obj_id
+                fresh.append(slot)
+            slots[k] = slot
+        if fresh:
+            self.head[fresh] = 0
+            self.count[fresh] = 0
+            self.has_speed[fresh] = False
+            self.speed[fresh] = 0
+            self.active[fresh] = True
+        return slots
+
+    def push(self, ids, centers, now):
+        """写入本帧所有 track 的中心点 (ids: (N,), centers: (N, 2))，返回 slot 数组"""
+        self.tick += 1
+        ids = np.asarray(ids, dtype=np.int64)
+        slots = self.slots_for(ids)
+        if len(slots) == 0: return slots
+        h = self.head[slots]
+        self.pts[slots, h] = centers
+        self.ts[slots, h] = now
+        self.head[slots] = (h + 1) % self.history
+        self.count[slots] = np.minimum(self.count[slots] + 1, self.history)
+        self.seen[slots] = self.tick
+        return slots
+
+    def oldest(self, slots):
+        idx = (self.head[slots] - self.count[slots]) % self.history
+        return self.pts[slots, idx], self.ts[slots, idx]
+
+    def newest(self, slots):
+        idx = (self.head[slots] - 1) % self.history
+        return self.pts[slots, idx], self.ts[slots, idx]
+
+    def update_speeds(self, slots, pixels_per_meter, min_samples=3, min_dt=0.01):
+        """用最早与最新历史点估算速度 (km/h)，样本不足或时间差太小时保留旧值"""
+        if len(slots) == 0: return
+        p0, t0 = self.oldest(slots)
+        p1, t1 = self.newest(slots)
+        dist_px = np.hypot(p1[:, 0] - p0[:, 0], p1[:, 1] - p0[:, 1])
+        dt = t1 - t0
+        ok = (self.count[slots] >= min_samples) & (dt > min_dt)
+        if not ok.any(): return
+        upd = slots[ok]
+        self.speed[upd] = (dist_px[ok] / pixels_per_meter) / dt[ok] * 3.6
+        self.has_speed[upd] = True
+
+    def crossings(self, slots, line_y):
+        """过线方向：+1 向下穿越，-1 向上穿越，0 未穿越 (以最早历史点为起点)"""
+        if len(slots) == 0: return np.zeros(0, dtype=np.int8)
+        prev_y = self.oldest(slots)[0][:, 1]
+        cy = self.newest(slots)[0][:, 1]
+        down = (prev_y < line_y) & (cy >= line_y)
+        up = (prev_y > line_y) & (cy <= line_y)
+        return down.astype(np.int8) - up.astype(np.int8)
+
+    def speeds_of(self, slots):
+        """返回 (ids, 整数速度) 仅包含已有测速结果的 track"""
+        valid = slots[self.has_speed[slots]]
+        return self.ids[valid], self.speed[valid].astype(np.int64)
+
+    def evict_stale(self, max_age=0):
+        """清理超过 max_age 次 push 未出现的 track，返回被清理的 ID"""
+        stale = np.flatnonzero(self.active & (self.seen < self.tick - max_age))
+        if len(stale) == 0: return []
+        gone = self.ids[stale].tolist()
+        for obj_id in gone: del self.slot_of[obj_id]
+        self.active[stale] = False
+        self.ids[stale] = -1
+        self.free.extend(stale.tolist())
+        return gone
@@ -0,0 +1,41 @@
+# 独立的 ByteTrack 跟踪器状态
+# ultralytics 的 model.track(persist=True) 把跟踪器挂在模型对象上，
+# 导致 "一路摄像头 = 一份模型"。这里把跟踪器拆成轻量对象：
+# 检测权重只加载一次，每路摄像头只持有自己的 BYTETracker。
+from functools import lru_cache
+import numpy as np
+
+TRACKER_CFG = "bytetrack.yaml"
+# 替代 model.track 的检测置信度阈值 (ultralytics 跟踪默认 0.1)：
+# ByteTrack 第二轮关联要用 0.1~0.25 的低分框，按检测默认 0.25 过滤会导致轨迹 ID 频繁切换
+TRACK_CONF = 0.1
+EMPTY_TRACKS = np.zeros((0, 8), dtype=np.float32)
+
+
+@lru_cache(maxsize=None)
+def _tracker_args(cfg_name):
+    """跟踪器配置只解析一次，新摄像头加入时无需再读 yaml"""
+    from ultralytics.utils import IterableSimpleNamespace, yaml_load
+    from ultralytics.utils.checks import check_yaml
+    return IterableSimpleNamespace(**yaml_load(check_yaml(cfg_name)))
+
+
+def create_tracker(cfg_name=TRACKER_CFG, frame_rate=30):
+    """按 ultralytics 的方式读取 bytetrack.yaml 并创建一个独立的跟踪器"""
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    return BYTETracker(args=_tracker_args(cfg_name), frame_rate=frame_rate)
+
+
+def update_tracker(tracker, det, img=None):
+    """
+    用一帧的检测结果推进跟踪器。
+    det: 具有 xyxy/xywh/conf/cls 的检测对象 (detector.Detections 或 Boxes.cpu().numpy())
+    返回 (N, 8) 数组: x1, y1, x2, y2, track_id, score, cls, det_idx
+    """
+    # 与 ultralytics.trackers.track 保持一致：空检测不推进跟踪器
+    if det is None or len(det) == 0:
+        return EMPTY_TRACKS
+    tracks = tracker.update(det, img)
+    if len(tracks) == 0:
+        return EMPTY_TRACKS
+    return np.asarray(tracks, dtype=np.float32)
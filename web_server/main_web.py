@@ -1,5 +1,6 @@
 import time
 import json
+import threading
 import redis
 from flask import Flask, Response, jsonify, render_template_string
 
@@ -234,19 +235,75 @@ def get_data():
         
     return jsonify(data)
 
-def generate(index):
-    while True:
-        # 从 Redis 读取二进制图片
-        img_bytes = r_img.get(f"cam_{index}_img")
-        if img_bytes:
-            yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + img_bytes + b'\r\n')
-        else:
-            time.sleep(0.1) # 没图时等待，防空转
-        time.sleep(0.04)
+class RedisFeedHub:
+    """
+    每路摄像头一个拉流线程：只从 Redis 读一次图片，
+    新图片的同一份字节分发给所有浏览器连接，慢连接直接跳到最新帧。
+    """
+    def __init__(self, idle_timeout=5.0):
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.feeds = {}
+
+    def _feed(self, index):
+        with self.lock:
+            if index not in self.feeds:
+                self.feeds[index] = {"cond": threading.Condition(), "seq": 0, "chunk": None,
+                                     "subscribers": 0, "thread": None}
+            return self.feeds[index]
+
+    def _poll_loop(self, index, feed):
+        last_img = None
+        idle_since = None
+        while True:
+            with feed["cond"]:
+                if feed["subscribers"] == 0:
+                    idle_since = idle_since or time.time()
+                    if time.time() - idle_since > self.idle_timeout:
+                        feed["thread"] = None
+                        return
+                else:
+                    idle_since = None
+
+            # 从 Redis 读取二进制图片
+            img_bytes = r_img.get(f"cam_{index}_img")
+            if not img_bytes:
+                time.sleep(0.1) # 没图时等待，防空转
+                continue
+            if img_bytes != last_img:
+                last_img = img_bytes
+                chunk = b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + img_bytes + b'\r\n'
+                with feed["cond"]:
+                    feed["chunk"] = chunk
+                    feed["seq"] += 1
+                    feed["cond"].notify_all()
+            time.sleep(0.04)
+
+    def stream(self, index):
+        feed = self._feed(index)
+        cond = feed["cond"]
+        with cond:
+            feed["subscribers"] += 1
+            if feed["thread"] is None:
+                feed["thread"] = threading.Thread(target=self._poll_loop, args=(index, feed), daemon=True)
+                feed["thread"].start()
+        try:
+            last = 0
+            while True:
+                with cond:
+                    if not cond.wait_for(lambda: feed["seq"] > last, timeout=1.0):
+                        continue
+                    last, chunk = feed["seq"], feed["chunk"]
+                yield chunk
+        finally:
+            with cond:
+                feed["subscribers"] -= 1
+
+FEED_HUB = RedisFeedHub()
 
 @app.route('/feed/<int:idx>')
 def feed(idx):
-    return Response(generate(idx), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(FEED_HUB.stream(idx), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, threaded=True)